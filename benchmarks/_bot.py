@@ -0,0 +1,19 @@
+"""Helpers for loading morning-bot.py from the benchmark scripts."""
+import importlib.util
+import os
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def load_bot():
+    """Import morning-bot.py as a module (the file name is not importable)."""
+    os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+    if "morning_bot" in sys.modules:
+        return sys.modules["morning_bot"]
+    spec = importlib.util.spec_from_file_location("morning_bot", ROOT / "morning-bot.py")
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["morning_bot"] = module
+    spec.loader.exec_module(module)
+    return module
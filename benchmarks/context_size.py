@@ -0,0 +1,112 @@
+"""Benchmark: prompt size and build time of the follow-up context.
+
+Compares the previous f-string context (dict reprs of the last five
+messages) with build_context for sessions of growing length, using the
+bot's local token estimate. Then checks a context cut down to a tight
+budget keeps every preference and the newest turns.
+
+    python benchmarks/context_size.py --budget 1500 --tight-budget 200
+"""
+import argparse
+import sys
+import time
+from datetime import datetime
+
+from _bot import load_bot
+
+TURN = "Could you suggest a short stretching sequence before breakfast, maybe ten minutes long?"
+
+
+def make_session(bot, turns: int):
+    history = bot.ConversationHistory(bot.HISTORY_WINDOW)
+    for i in range(turns):
+        history.append("user" if i % 2 == 0 else "assistant", f"{TURN} ({i})")
+    user_data = {
+        "current_habits": ["coffee", "check email", "shower"],
+        "energizing_activities": ["running", "music", "sunlight"],
+        "goals": ["focus at work", "less stress"],
+        "conversation_history": history,
+        "summary": bot.RollingSummary(),
+    }
+    if turns > bot.HISTORY_WINDOW:
+        user_data["summary"].text = "The user wants a calmer start and is trying a 6am wake-up. " * 3
+    return user_data
+
+
+def legacy_messages(history, count: int) -> list:
+    """The message dicts the old context printed for the last count turns."""
+    return [
+        {"role": r.role, "content": r.content, "timestamp": datetime.fromtimestamp(r.timestamp).isoformat()}
+        for r in history.recent(count)
+    ]
+
+
+def legacy_context(user_data) -> str:
+    return f"""
+        User's preferences:
+        - Current habits: {', '.join(user_data['current_habits'])}
+        - Energizing activities: {', '.join(user_data['energizing_activities'])}
+        - Goals: {', '.join(user_data['goals'])}
+        
+        Previous conversation: {str(legacy_messages(user_data['conversation_history'], 5))}
+        """
+
+
+def check_truncation(bot, budget: int) -> list:
+    """Problems with a context cut down to budget: preferences must all be
+    kept, and the history turns kept must be the newest ones."""
+    user_data = make_session(bot, 50)
+    context = bot.followup_context(user_data, budget)
+    problems = []
+    for field in bot.preference_fields(user_data):
+        if f"{field.label}: {field.separator.join(field.items)}" not in context:
+            problems.append(f"{field.label} dropped")
+    history = user_data["conversation_history"]
+    turns = bot.render_history(history.recent(len(history))[:-1])
+    _, _, kept = context.partition("Previous conversation:\n")
+    kept = kept.split("\n") if kept else []
+    if not kept or len(kept) >= len(turns):
+        problems.append(f"{len(kept)} of {len(turns)} turns kept, expected some but not all")
+    elif kept != turns[-len(kept):]:
+        problems.append("kept turns are not the newest ones")
+    if bot.estimate_tokens(context) > budget:
+        problems.append("over budget")
+    return problems
+
+
+def time_per_call(func, repeat: int = 2000) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def run(budget: int, tight_budget: int) -> int:
+    bot = load_bot()
+    print(f"{'turns':>5} {'legacy tokens':>14} {'new tokens':>11} {'legacy us':>10} {'new us':>8}")
+    over_budget = False
+    for turns in (2, 5, 10, 20, 50):
+        user_data = make_session(bot, turns)
+        legacy = legacy_context(user_data)
+        new = bot.followup_context(user_data, budget)
+        legacy_us = time_per_call(lambda: legacy_context(user_data)) * 1e6
+        new_us = time_per_call(lambda: bot.followup_context(user_data, budget)) * 1e6
+        new_tokens = bot.estimate_tokens(new)
+        over_budget |= new_tokens > budget
+        print(f"{turns:>5} {bot.estimate_tokens(legacy):>14} {new_tokens:>11} {legacy_us:>10.1f} {new_us:>8.1f}")
+    if over_budget:
+        print("FAIL: context exceeded the token budget")
+        return 1
+    problems = check_truncation(bot, tight_budget)
+    for problem in problems:
+        print(f"FAIL: at a budget of {tight_budget}: {problem}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--budget", type=int, default=1500)
+    parser.add_argument("--tight-budget", type=int, default=200,
+                        help="budget small enough to cut the history, for the truncation check")
+    args = parser.parse_args()
+    sys.exit(run(args.budget, args.tight_budget))
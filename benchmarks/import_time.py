@@ -0,0 +1,71 @@
+"""Benchmark: startup cost of importing morning-bot.py.
+
+Imports the bot in a fresh interpreter under ``python -X importtime``,
+reports the total import time and the slowest modules, and checks that
+the Gemini SDK and DuckDuckGo client are not imported until first use.
+
+    python benchmarks/import_time.py --top 10
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+DEFERRED = ("google.generativeai", "duckduckgo_search")
+SCRIPT = """
+import sys
+from _bot import load_bot
+load_bot()
+print(",".join(name for name in {deferred!r} if name in sys.modules))
+"""
+
+
+def parse_importtime(stderr: str) -> list:
+    """Return (cumulative_us, module) for each line of -X importtime output, indent kept."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative), name[1:].rstrip()))
+    return rows
+
+
+def run(top: int) -> int:
+    env = dict(os.environ, GEMINI_API_KEY=os.environ.get("GEMINI_API_KEY", "benchmark"))
+    # Run from the repo root, where Chainlit expects its .chainlit directory
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(HERE), env.get("PYTHONPATH")]))
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", SCRIPT.format(deferred=DEFERRED)],
+        cwd=HERE.parent, env=env, capture_output=True, text=True,
+    )
+    wall = time.perf_counter() - start
+    if proc.returncode:
+        print(proc.stderr[-2000:])
+        return proc.returncode
+
+    rows = parse_importtime(proc.stderr)
+    # Only modules at the top of an import chain count towards the total
+    roots = [(us, name) for us, name in rows if not name.startswith(" ")]
+    total = sum(us for us, _ in roots)
+    print(f"interpreter wall={wall * 1000:.0f}ms imports={total / 1000:.1f}ms modules={len(rows)}")
+    print(f"{'cumulative ms':>13}  module")
+    for us, name in sorted(roots, reverse=True)[:top]:
+        print(f"{us / 1000:>13.1f}  {name.strip()}")
+
+    eager = [name for name in proc.stdout.strip().split(",") if name]
+    if eager:
+        print(f"FAIL: imported at startup: {', '.join(eager)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+    sys.exit(run(args.top))
@@ -0,0 +1,78 @@
+"""Benchmark: message routing.
+
+Compares route_message with the substring scans it replaced, for messages
+with and without routing keywords, and times training and running the
+classifier. Where messages are routed is tested in tests/test_intent_router.py.
+
+    python benchmarks/intent_router.py
+"""
+import sys
+import time
+
+from _bot import load_bot
+
+# Messages with routing keywords; tests/test_intent_router.py checks where
+# these and more are routed
+KEYWORD_MESSAGES = [
+    "find me a motivational morning routine video on youtube.",
+    "find me some morning routine tips and articles.",
+    "show me videos about yoga",
+    "search for stretching routines",
+    "can you look for breakfast ideas",
+    "search youtube for meditation",
+    "find me videos and articles about yoga",
+    "any youtube clips or blog posts on journaling",
+    "search the web and youtube for yoga",
+    "i am watchful of my sleep",
+    "overlook for now",
+]
+
+
+def legacy_route(content: str):
+    if any(keyword in content for keyword in ["youtube", "video", "watch"]):
+        query = content
+        for keyword in ["youtube", "video", "watch", "find", "search"]:
+            query = query.replace(keyword, "").strip()
+        return "video", query
+    if any(keyword in content for keyword in ["search", "find", "look for"]):
+        query = content
+        for keyword in ["search", "find", "look for"]:
+            query = query.replace(keyword, "").strip()
+        return "web", query
+    return None, content
+
+
+# Everyday replies with no routing keywords, the bulk of real traffic
+CHAT_MESSAGES = [
+    "coffee, check email, shower",
+    "running, music, sunlight",
+    "focus at work, less stress",
+    "how long should the stretching take?",
+    "what if i only have 20 minutes?",
+]
+
+
+def per_call_us(route, messages: list, repeat: int = 2000) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for message in messages:
+            route(message)
+    return (time.perf_counter() - start) / (repeat * len(messages)) * 1e6
+
+
+def run() -> int:
+    bot = load_bot()
+    start = time.perf_counter()
+    bot.get_intent_classifier()
+    print(f"classifier trained in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    print(f"route_message:    {per_call_us(bot.route_message, KEYWORD_MESSAGES):.2f} us/message"
+          f" ({per_call_us(bot.route_message, CHAT_MESSAGES):.2f} without keywords)")
+    print(f"legacy scans:     {per_call_us(legacy_route, KEYWORD_MESSAGES):.2f} us/message"
+          f" ({per_call_us(legacy_route, CHAT_MESSAGES):.2f} without keywords)")
+    print(f"classify_message: {per_call_us(bot.classify_message, KEYWORD_MESSAGES, repeat=200):.2f} us/message")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run())
@@ -0,0 +1,256 @@
+"""Load test: many concurrent chat sessions against one bot process.
+
+Drives on_chat_start and on_message directly with scripted conversations
+(the starters, the habits/activities/goals sequence, follow-ups and
+searches), using the offline FakeBackend for Gemini and the replay search
+provider. Reports turns per second, p50/p95/p99 turn latency per branch,
+event loop lag and memory growth, and can write the results as JSON. With
+--baseline, exits non-zero when a branch's p95 regressed past --tolerance
+or a backend fails more often.
+
+    python benchmarks/load_test.py --users 50 --sessions 500 --json results.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import time
+from collections import defaultdict
+
+# Offline backends unless the caller chose otherwise
+os.environ.setdefault("LLM_BACKEND", "fake")
+os.environ.setdefault("SEARCH_PROVIDER", "replay")
+
+from _bot import load_bot
+
+HABITS = ["coffee, check email, shower", "snooze twice, scroll my phone", "tea, news, walk the dog"]
+ACTIVITIES = ["running, music, sunlight", "yoga, cold shower", "journaling, a long breakfast"]
+GOALS = ["focus at work, less stress", "more energy, read more", "get fit, start earlier"]
+FOLLOW_UPS = [
+    "How long should the stretching take?",
+    "Can I do this on weekends too?",
+    "What if I only have 20 minutes?",
+    "Should I eat before or after exercising?",
+]
+
+
+def script(bot, kind: str, rng: random.Random) -> list:
+    """(branch, message) turns of one scripted conversation."""
+    if kind == "routine":
+        return [
+            ("opener", bot.STARTER_ROUTINE),
+            ("habits", rng.choice(HABITS)),
+            ("activities", rng.choice(ACTIVITIES)),
+            ("goals", rng.choice(GOALS)),
+            ("followup", rng.choice(FOLLOW_UPS)),
+            ("followup", rng.choice(FOLLOW_UPS)),
+        ]
+    if kind == "video":
+        return [("video", bot.STARTER_VIDEO), ("video", "show me yoga videos")]
+    if kind == "web":
+        return [("web", bot.STARTER_WEB), ("web", "tips for waking up early")]
+    return [("all", "find me videos and articles about yoga")]
+
+
+# Share of sessions following each script
+MIX = {"routine": 0.5, "video": 0.2, "web": 0.2, "all": 0.1}
+
+
+def new_session_context() -> None:
+    """Give the current task its own Chainlit session, as a websocket connection would."""
+    from chainlit.context import init_http_context
+    init_http_context()
+
+
+def percentile(values: list, p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def summarize(values: list) -> dict:
+    return {
+        "count": len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values, default=0.0),
+    }
+
+
+def rss_bytes() -> int:
+    """Current resident set size, or the peak where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        scale = 1 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+async def sample_loop_lag(stop: asyncio.Event, lags: list, interval: float = 0.01) -> None:
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(max(0.0, time.perf_counter() - start - interval))
+
+
+async def run_session(bot, kind: str, rng: random.Random, think: float, latencies: dict) -> None:
+    new_session_context()
+    await bot.on_chat_start()
+    for branch, text in script(bot, kind, rng):
+        start = time.perf_counter()
+        await bot.on_message(bot.cl.Message(content=text))
+        latencies[branch].append(time.perf_counter() - start)
+        if think:
+            await asyncio.sleep(rng.expovariate(1 / think))
+    await bot.on_chat_end()
+
+
+async def user(bot, sessions: asyncio.Queue, think: float, latencies: dict) -> None:
+    while True:
+        try:
+            index, kind = sessions.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+        await run_session(bot, kind, random.Random(index), think, latencies)
+
+
+async def run(args) -> dict:
+    bot = load_bot()
+    bot.llm_backend = bot.FakeBackend(
+        latency=args.llm_latency, tokens_per_second=args.llm_tokens_per_second,
+        error_rate=args.llm_error_rate, seed=args.seed,
+    )
+    bot.search_provider = bot.FixtureProvider(latency=args.search_latency)
+
+    rng = random.Random(args.seed)
+    sessions: asyncio.Queue = asyncio.Queue()
+    for index in range(args.sessions):
+        sessions.put_nowait((index, rng.choices(list(MIX), weights=list(MIX.values()))[0]))
+
+    latencies: dict = defaultdict(list)
+    lags: list = []
+    stop = asyncio.Event()
+    rss_start = rss_bytes()
+    lag_task = asyncio.create_task(sample_loop_lag(stop, lags))
+    start = time.perf_counter()
+    await asyncio.gather(*(user(bot, sessions, args.think, latencies) for _ in range(args.users)))
+    elapsed = time.perf_counter() - start
+    # Let background work still running finish so every call is counted
+    pending = bot.background_tasks - {bot._warmup_task}
+    await asyncio.gather(*pending, return_exceptions=True)
+    stop.set()
+    await lag_task
+    rss_end = rss_bytes()
+
+    turns = sum(len(values) for values in latencies.values())
+    return {
+        "config": {
+            "users": args.users, "sessions": args.sessions, "think": args.think, "seed": args.seed,
+            "llm_latency": args.llm_latency, "llm_tokens_per_second": args.llm_tokens_per_second,
+            "llm_error_rate": args.llm_error_rate, "search_latency": args.search_latency,
+            "streaming": bot.GEMINI_STREAMING, "python": platform.python_version(),
+        },
+        "timestamp": time.time(),
+        "elapsed": elapsed,
+        "turns": turns,
+        "turns_per_second": turns / elapsed,
+        "sessions_per_second": args.sessions / elapsed,
+        "branches": {branch: summarize(values) for branch, values in sorted(latencies.items())},
+        "loop_lag": summarize(lags),
+        "memory": {
+            "rss_start": rss_start,
+            "rss_end": rss_end,
+            "growth": rss_end - rss_start,
+            "growth_per_session": (rss_end - rss_start) / max(args.sessions, 1),
+            "live_sessions": len(bot.sessions),
+        },
+        "backends": {
+            backend: {
+                "calls": counts["calls"],
+                "failed": counts["calls"] - counts["successes"],
+                "retries": counts["retries"],
+                "breaker": bot.circuit_breakers[backend].stats(),
+            }
+            for backend, counts in bot.retry_metrics.items()
+        },
+        "admission": bot.llm_admission.stats(),
+    }
+
+
+def report(results: dict) -> None:
+    print(f"sessions={results['config']['sessions']} users={results['config']['users']} "
+          f"elapsed={results['elapsed']:.2f}s turns/s={results['turns_per_second']:.1f} "
+          f"sessions/s={results['sessions_per_second']:.1f}")
+    print(f"{'branch':<11} {'turns':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    rows = list(results["branches"].items()) + [("loop lag", results["loop_lag"])]
+    for branch, s in rows:
+        print(f"{branch:<11} {s['count']:>6} {s['p50'] * 1000:>8.1f} {s['p95'] * 1000:>8.1f} "
+              f"{s['p99'] * 1000:>8.1f} {s['max'] * 1000:>8.1f}")
+    memory = results["memory"]
+    print(f"rss {memory['rss_start'] / 2**20:.1f} -> {memory['rss_end'] / 2**20:.1f} MiB "
+          f"({memory['growth_per_session'] / 1024:.1f} KiB/session, {memory['live_sessions']} live sessions)")
+    for backend, b in results["backends"].items():
+        print(f"{backend}: calls={b['calls']} failed={b['failed']} retries={b['retries']} "
+              f"breaker opened {b['breaker']['opened']}x, rejected {b['breaker']['rejected']}")
+
+
+def failure_rate(backend: dict) -> float:
+    return backend["failed"] / backend["calls"] if backend["calls"] else 0.0
+
+
+def regressions(results: dict, baseline: dict, tolerance: float) -> list:
+    """Branches whose p95 grew by more than tolerance over the baseline.
+
+    Failing fast can make a run look quicker, so a backend failing more
+    than one call in a hundred more often also counts.
+    """
+    slower = []
+    for branch, s in results["branches"].items():
+        before = baseline.get("branches", {}).get(branch)
+        if before and s["p95"] > before["p95"] * (1 + tolerance):
+            slower.append(f"{branch}: p95 {before['p95'] * 1000:.1f}ms -> {s['p95'] * 1000:.1f}ms")
+    for backend, b in results["backends"].items():
+        before = baseline.get("backends", {}).get(backend)
+        if before and failure_rate(b) > failure_rate(before) + 0.01:
+            slower.append(f"{backend}: failure rate {failure_rate(before):.1%} -> {failure_rate(b):.1%}")
+    return slower
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=50, help="concurrent sessions")
+    parser.add_argument("--sessions", type=int, default=500, help="conversations to run in total")
+    parser.add_argument("--think", type=float, default=0.0, help="mean pause between turns, seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--llm-latency", type=float, default=0.4)
+    parser.add_argument("--llm-tokens-per-second", type=float, default=150)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--search-latency", type=float, default=0.3)
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="results file from an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95 growth over the baseline")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    report(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            slower = regressions(results, json.load(f), args.tolerance)
+        for line in slower:
+            print(f"REGRESSION {line}")
+        return 1 if slower else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
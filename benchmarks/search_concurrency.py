@@ -0,0 +1,71 @@
+"""Load test: concurrent searches must not serialize on the event loop.
+
+Replaces the DuckDuckGo client with one that blocks for a fixed latency,
+fires N searches at once and checks that the wall time stays close to a
+single search instead of N of them. Event loop lag is sampled while the
+searches are in flight.
+
+    python benchmarks/search_concurrency.py --searches 8 --latency 0.5
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+from _bot import load_bot
+
+
+class SlowDDGS:
+    name = "slow"
+    latency = 0.5
+
+    def text(self, query, max_results=3):
+        time.sleep(self.latency)
+        return [{"title": query, "link": "https://example.com", "snippet": "..."}]
+
+    def videos(self, query, max_results=3):
+        time.sleep(self.latency)
+        return [{"title": query, "link": "https://youtube.com", "duration": "1:00", "channel": "bench"}]
+
+
+async def sample_loop_lag(stop: asyncio.Event, interval: float = 0.01) -> float:
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - start - interval)
+    return worst
+
+
+async def run(searches: int, latency: float) -> int:
+    bot = load_bot()
+    SlowDDGS.latency = latency
+    bot.search_provider = SlowDDGS()
+
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(sample_loop_lag(stop))
+    start = time.perf_counter()
+    calls = [
+        bot.search_youtube(f"query {i}") if i % 2 else bot.search_web(f"query {i}")
+        for i in range(searches)
+    ]
+    results = await asyncio.gather(*calls)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    worst_lag = await lag_task
+
+    waves = -(-searches // bot.SEARCH_MAX_WORKERS)
+    serialized = searches * latency
+    print(f"searches={searches} workers={bot.SEARCH_MAX_WORKERS} latency={latency:.3f}s")
+    print(f"wall={elapsed:.3f}s serialized={serialized:.3f}s worst_loop_lag={worst_lag * 1000:.1f}ms")
+    ok = all(results) and elapsed < waves * latency + latency / 2
+    print("OK" if ok else "FAIL: searches serialized")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--searches", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.5)
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args.searches, args.latency)))
@@ -1,62 +1,876 @@
 import chainlit as cl
-from typing import Dict, List, TypedDict, Optional
+from typing import TYPE_CHECKING, Any, AsyncIterator, Awaitable, Callable, Dict, List, Protocol, TypedDict, Optional
+import asyncio
+import atexit
+import contextlib
+import contextvars
+import functools
+import hashlib
+import heapq
+import itertools
+import json
+import logging
+import logging.handlers
+import math
 import os
+import queue
+import random
+import re
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from collections import Counter, OrderedDict, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-import google.generativeai as genai
-from datetime import datetime
-from duckduckgo_search import DDGS
+
+if TYPE_CHECKING:
+    # Imported on first use; both are slow to import
+    import google.generativeai as genai
+    from duckduckgo_search import DDGS
 
 # Load environment variables
 load_dotenv()
 
+# Logging: records are queued on the calling thread and written by a
+# background listener thread, so the event loop never waits on stdio.
+# Messages use %-style arguments, which are only formatted for enabled levels.
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text').lower()  # text or json
+
+# Correlation ID of the chat message being handled; tasks started while
+# handling it inherit the ID
+request_id: contextvars.ContextVar[str] = contextvars.ContextVar("request_id", default="-")
+
+_LOG_RECORD_FIELDS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "request_id"}
+
+class RequestIdFilter(logging.Filter):
+    """Stamp records with the current request ID, in the context that logged them."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id.get()
+        return True
+
+class StructuredFormatter(logging.Formatter):
+    """One line per record: JSON, or text with extra fields as key=value pairs."""
+
+    def __init__(self, as_json: bool):
+        super().__init__()
+        self.as_json = as_json
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = {k: v for k, v in vars(record).items() if k not in _LOG_RECORD_FIELDS}
+        message = record.getMessage()
+        if record.exc_info:
+            message += "\n" + self.formatException(record.exc_info)
+        if self.as_json:
+            return json.dumps({
+                "time": self.formatTime(record),
+                "level": record.levelname,
+                "logger": record.name,
+                "request_id": record.request_id,
+                "message": message,
+                **fields,
+            }, default=str)
+        extra = "".join(f" {k}={v}" for k, v in fields.items())
+        return f"{self.formatTime(record)} {record.levelname} [{record.request_id}] {message}{extra}"
+
+def setup_logging() -> logging.Logger:
+    """Configure the morning_bot logger, replacing any earlier setup.
+
+    Chainlit's reload (-w) runs this module again in the same process; the
+    previous listener is kept on the logger so it can be stopped here.
+    """
+    logger = logging.getLogger("morning_bot")
+    previous = getattr(logger, "listener", None)
+    if previous is not None:
+        atexit.unregister(previous.stop)
+        previous.stop()
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(records)
+    queue_handler.addFilter(RequestIdFilter())
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(StructuredFormatter(LOG_FORMAT == "json"))
+    listener = logging.handlers.QueueListener(records, stream_handler)
+    listener.start()
+    atexit.register(listener.stop)
+    logger.listener = listener
+    logger.addHandler(queue_handler)
+    return logger
+
+log = setup_logging()
+
 # Type definitions
-class Message(TypedDict):
-    role: str
-    content: str
-    timestamp: str
+class HistoryRecord:
+    """One conversation turn, timestamped with time.time()."""
+
+    __slots__ = ("role", "content", "timestamp")
+
+    def __init__(self, role: str, content: str, timestamp: float):
+        self.role = role
+        self.content = content
+        self.timestamp = timestamp
+
+class ConversationHistory:
+    """Ring buffer holding the most recent turns of a conversation.
+
+    Appending to a full buffer drops the oldest record and passes it to each
+    of the evict handlers.
+    """
+
+    __slots__ = ("_records", "evict_handlers")
+
+    def __init__(self, capacity: int, evict_handlers: List[Callable[[HistoryRecord], None]] = None):
+        self._records: deque = deque(maxlen=capacity)
+        self.evict_handlers = evict_handlers or []
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def append(self, role: str, content: str) -> None:
+        if self.evict_handlers and len(self._records) == self._records.maxlen:
+            for handler in self.evict_handlers:
+                handler(self._records[0])
+        self._records.append(HistoryRecord(role, content, time.time()))
+
+    def recent(self, count: int) -> List[HistoryRecord]:
+        """The last count records, oldest first."""
+        start = max(0, len(self._records) - count)
+        return list(itertools.islice(self._records, start, None))
 
 class UserData(TypedDict):
     current_habits: List[str]
     energizing_activities: List[str]
     goals: List[str]
-    conversation_history: List[Message]
+    conversation_history: ConversationHistory
+    summary: "RollingSummary"
+
+# LLM backend: gemini, or fake for offline load tests (see FakeBackend)
+LLM_BACKEND = os.getenv('LLM_BACKEND', 'gemini').lower()
 
-# Configure Gemini
+# Configure Gemini. The client is built on first use, but a missing key
+# should still stop the app at startup.
+GEMINI_MODEL = 'gemini-2.0-flash'
 try:
-    api_key = os.getenv('GEMINI_API_KEY')
-    if not api_key:
+    if LLM_BACKEND == 'gemini' and not os.getenv('GEMINI_API_KEY'):
         raise ValueError("GEMINI_API_KEY not found in environment variables")
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel('gemini-2.0-flash')
 except Exception as e:
-    print(f"Error configuring Gemini: {str(e)}")
+    log.error("Error configuring Gemini: %s", e)
     raise
 
-# Initialize DuckDuckGo search
-ddgs = DDGS()
+_model: Optional["genai.GenerativeModel"] = None
+_model_lock = threading.Lock()
+
+def get_model() -> "genai.GenerativeModel":
+    """Import and configure Gemini on first use; blocks, so call it off the event loop."""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                import google.generativeai as genai
+                genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
+                _model = genai.GenerativeModel(GEMINI_MODEL)
+    return _model
+
+async def load_model() -> "genai.GenerativeModel":
+    """get_model() for async code: the first call runs in a worker thread."""
+    if _model is not None:
+        return _model
+    return await asyncio.to_thread(get_model)
+
+# Offline fake backend: median first-token latency and its spread (lognormal
+# sigma), output speed, reply length and the share of calls that fail
+FAKE_LLM_LATENCY = float(os.getenv('FAKE_LLM_LATENCY', '0.4'))
+FAKE_LLM_LATENCY_SIGMA = float(os.getenv('FAKE_LLM_LATENCY_SIGMA', '0.5'))
+FAKE_LLM_TOKENS_PER_SECOND = float(os.getenv('FAKE_LLM_TOKENS_PER_SECOND', '150'))
+FAKE_LLM_OUTPUT_TOKENS = int(os.getenv('FAKE_LLM_OUTPUT_TOKENS', '200'))
+FAKE_LLM_ERROR_RATE = float(os.getenv('FAKE_LLM_ERROR_RATE', '0'))
+FAKE_LLM_SEED = int(os.getenv('FAKE_LLM_SEED', '0'))
+
+# Stream model output into the chat as it is generated
+GEMINI_STREAMING = os.getenv('GEMINI_STREAMING', 'true').lower() in ('1', 'true', 'yes')
+GENERATION_CONFIG: Dict[str, Any] = {}
+
+# Response cache for repeated prompts
+LLM_CACHE_TTL = float(os.getenv('LLM_CACHE_TTL', '86400'))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', '1024'))
+LLM_CACHE_MAX_BYTES = int(os.getenv('LLM_CACHE_MAX_BYTES', str(16 * 1024 * 1024)))
+LLM_CACHE_DB = os.getenv('LLM_CACHE_DB', '')
+LLM_CACHE_DB_MAX_BYTES = int(os.getenv('LLM_CACHE_DB_MAX_BYTES', str(128 * 1024 * 1024)))
+
+# Gemini admission control; a rate of 0 disables that limit
+LLM_MAX_IN_FLIGHT = int(os.getenv('LLM_MAX_IN_FLIGHT', '16'))
+LLM_REQUESTS_PER_MINUTE = float(os.getenv('LLM_REQUESTS_PER_MINUTE', '2000'))
+LLM_TOKENS_PER_MINUTE = float(os.getenv('LLM_TOKENS_PER_MINUTE', '4000000'))
+LLM_QUEUE_TIMEOUT = float(os.getenv('LLM_QUEUE_TIMEOUT', '30'))
+LLM_EXPECTED_OUTPUT_TOKENS = int(os.getenv('LLM_EXPECTED_OUTPUT_TOKENS', '512'))
+# Estimated tokens of user context sent with each prompt
+CONTEXT_TOKEN_BUDGET = int(os.getenv('CONTEXT_TOKEN_BUDGET', '1500'))
+
+# Semantic cache for near-duplicate follow-up questions
+SEMANTIC_CACHE_ENABLED = os.getenv('SEMANTIC_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+SEMANTIC_CACHE_EMBEDDER = os.getenv('SEMANTIC_CACHE_EMBEDDER', 'local')  # local or gemini
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv('SEMANTIC_CACHE_THRESHOLD', '0.95'))
+SEMANTIC_CACHE_TTL = float(os.getenv('SEMANTIC_CACHE_TTL', '86400'))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv('SEMANTIC_CACHE_MAX_ENTRIES', '512'))
+# Share of cache hits re-answered in the background to measure false hits
+SEMANTIC_CACHE_VERIFY_RATE = float(os.getenv('SEMANTIC_CACHE_VERIFY_RATE', '0.05'))
+SEMANTIC_CACHE_VERIFY_THRESHOLD = float(os.getenv('SEMANTIC_CACHE_VERIFY_THRESHOLD', '0.4'))
+
+# Search settings
+SEARCH_MAX_WORKERS = int(os.getenv('SEARCH_MAX_WORKERS', '8'))
+SEARCH_TIMEOUT = float(os.getenv('SEARCH_TIMEOUT', '10'))
+SEARCH_CACHE_TTL = float(os.getenv('SEARCH_CACHE_TTL', '3600'))
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv('SEARCH_CACHE_MAX_ENTRIES', '512'))
+SEARCH_CACHE_MAX_BYTES = int(os.getenv('SEARCH_CACHE_MAX_BYTES', str(4 * 1024 * 1024)))
+# Optional on-disk cache shared by all workers on the host; empty disables it
+SEARCH_CACHE_DB = os.getenv('SEARCH_CACHE_DB', '')
+SEARCH_CACHE_DB_MAX_BYTES = int(os.getenv('SEARCH_CACHE_DB_MAX_BYTES', str(64 * 1024 * 1024)))
+# Search provider: duckduckgo; replay to serve SEARCH_FIXTURES offline with
+# a simulated latency; record to search DuckDuckGo and save to SEARCH_FIXTURES
+SEARCH_PROVIDER = os.getenv('SEARCH_PROVIDER', 'duckduckgo').lower()
+SEARCH_FIXTURES = os.getenv(
+    'SEARCH_FIXTURES', os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "search_fixtures.jsonl")
+)
+SEARCH_REPLAY_LATENCY = float(os.getenv('SEARCH_REPLAY_LATENCY', '0.3'))
+SEARCH_REPLAY_LATENCY_SIGMA = float(os.getenv('SEARCH_REPLAY_LATENCY_SIGMA', '0.5'))
+
+# Retries and latency budgets
+RETRY_MAX_ATTEMPTS = int(os.getenv('RETRY_MAX_ATTEMPTS', '3'))
+RETRY_BASE_DELAY = float(os.getenv('RETRY_BASE_DELAY', '0.5'))
+RETRY_MAX_DELAY = float(os.getenv('RETRY_MAX_DELAY', '8'))
+# Upper bound in seconds on everything done to answer one user message
+TURN_BUDGET = float(os.getenv('TURN_BUDGET', '60'))
+
+# Circuit breakers: trip when a backend's recent calls mostly fail or are slow
+BREAKER_WINDOW = float(os.getenv('BREAKER_WINDOW', '60'))
+BREAKER_MIN_CALLS = int(os.getenv('BREAKER_MIN_CALLS', '10'))
+BREAKER_FAILURE_RATE = float(os.getenv('BREAKER_FAILURE_RATE', '0.5'))
+BREAKER_SLOW_CALL_RATE = float(os.getenv('BREAKER_SLOW_CALL_RATE', '0.8'))
+BREAKER_OPEN_SECONDS = float(os.getenv('BREAKER_OPEN_SECONDS', '30'))
+SEARCH_SLOW_CALL_SECONDS = float(os.getenv('SEARCH_SLOW_CALL_SECONDS', '5'))
+GEMINI_SLOW_CALL_SECONDS = float(os.getenv('GEMINI_SLOW_CALL_SECONDS', '30'))
+
+# Transient errors worth retrying, matched by class name so the provider
+# exception modules don't have to be imported here
+RETRYABLE_ERRORS = frozenset({
+    # google.api_core.exceptions
+    "Aborted", "DeadlineExceeded", "GatewayTimeout", "InternalServerError",
+    "ResourceExhausted", "ServiceUnavailable", "TooManyRequests",
+    # duckduckgo_search.exceptions
+    "RatelimitException", "TimeoutException",
+})
+
+class BudgetExceeded(asyncio.TimeoutError):
+    """Raised when a call would run past the current turn's latency budget."""
+
+# Monotonic deadline of the user turn being handled, if any
+turn_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("turn_deadline", default=None)
+
+# Per-backend call, attempt and outcome counts; "attempts_<n>" is a histogram
+retry_metrics: Dict[str, Counter] = defaultdict(Counter)
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a backend whose circuit breaker is open."""
+
+class CallTimer:
+    """When the backend part of a breaker call started, or None while it waits on our side."""
+
+    __slots__ = ("started",)
+
+    def __init__(self, started: Optional[float]):
+        self.started = started
+
+    def start(self) -> None:
+        """Mark the backend call as started; safe to call from a worker thread."""
+        self.started = time.monotonic()
+
+# Timer of the breaker call being made in this task, if any
+_call_timer: contextvars.ContextVar[Optional[CallTimer]] = contextvars.ContextVar("call_timer", default=None)
+
+def queued_call_timer() -> CallTimer:
+    """Stop the current breaker call's clock until the returned timer is started.
+
+    Callers that queue for our own resources (admission slots, thread pools)
+    use this so the breaker only times the backend. A call that fails before
+    its timer starts is not recorded at all.
+    """
+    timer = _call_timer.get()
+    if timer is None:
+        return CallTimer(None)
+    timer.started = None
+    return timer
+
+class CircuitBreaker:
+    """Closed/open/half-open breaker over a sliding time window of calls.
+
+    The breaker opens when at least min_calls recent calls have a failure rate
+    or slow-call rate at or above its thresholds. After open_seconds it lets a
+    single probe through (half-open): success closes it, failure reopens it.
+    Calls are timed from the start of func unless it uses queued_call_timer().
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str, slow_call_seconds: float, window: float = BREAKER_WINDOW,
+                 min_calls: int = BREAKER_MIN_CALLS, failure_rate: float = BREAKER_FAILURE_RATE,
+                 slow_call_rate: float = BREAKER_SLOW_CALL_RATE, open_seconds: float = BREAKER_OPEN_SECONDS):
+        self.name = name
+        self.slow_call_seconds = slow_call_seconds
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.opened = 0
+        self.rejected = 0
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._probing = False
+        self._calls: deque = deque()  # (finished_at, failed, slow)
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._state = self.HALF_OPEN
+        return self._state
+
+    async def call(self, func: Callable[[], Awaitable[Any]]) -> Any:
+        state = self.state
+        if state == self.OPEN or (state == self.HALF_OPEN and self._probing):
+            self.rejected += 1
+            raise CircuitOpenError(f"{self.name} is temporarily unavailable")
+        probe = state == self.HALF_OPEN
+        self._probing = self._probing or probe
+        timer = CallTimer(time.monotonic())
+        token = _call_timer.set(timer)
+        try:
+            result = await func()
+        except Exception as e:
+            # Errors raised by our own deadlines, or before the backend was
+            # reached, say nothing about the backend
+            if timer.started is not None and not isinstance(e, (BudgetExceeded, AdmissionTimeout)):
+                self._record(probe, failed=True, elapsed=time.monotonic() - timer.started)
+            raise
+        finally:
+            _call_timer.reset(token)
+            if probe:
+                self._probing = False
+        if timer.started is not None:
+            self._record(probe, failed=False, elapsed=time.monotonic() - timer.started)
+        return result
+
+    def _record(self, probe: bool, failed: bool, elapsed: float) -> None:
+        now = time.monotonic()
+        slow = elapsed >= self.slow_call_seconds
+        if probe:
+            self._calls.clear()
+            if failed or slow:
+                self._trip(now)
+            else:
+                self._state = self.CLOSED
+            return
+        self._calls.append((now, failed, slow))
+        while self._calls and self._calls[0][0] < now - self.window:
+            self._calls.popleft()
+        total = len(self._calls)
+        if self._state != self.CLOSED or total < self.min_calls:
+            return
+        failures = sum(1 for _, f, _ in self._calls if f)
+        slow_calls = sum(1 for _, _, sl in self._calls if sl)
+        if failures / total >= self.failure_rate or slow_calls / total >= self.slow_call_rate:
+            self._trip(now)
+
+    def _trip(self, now: float) -> None:
+        self._state = self.OPEN
+        self._opened_at = now
+        self._calls.clear()
+        self.opened += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {"state": self.state, "opened": self.opened, "rejected": self.rejected}
+
+circuit_breakers: Dict[str, CircuitBreaker] = {
+    "duckduckgo": CircuitBreaker("DuckDuckGo search", SEARCH_SLOW_CALL_SECONDS),
+    "gemini": CircuitBreaker("Gemini", GEMINI_SLOW_CALL_SECONDS),
+}
+
+def remaining_budget() -> Optional[float]:
+    """Seconds left in the current turn's budget, or None outside a turn."""
+    deadline = turn_deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+def is_retryable(error: BaseException) -> bool:
+    if isinstance(error, (BudgetExceeded, AdmissionTimeout, CircuitOpenError)):
+        return False
+    return isinstance(error, (asyncio.TimeoutError, ConnectionError)) or type(error).__name__ in RETRYABLE_ERRORS
+
+async def call_with_retries(backend: str, func: Callable[[], Awaitable[Any]],
+                            retryable: Callable[[BaseException], bool] = is_retryable) -> Any:
+    """Await func(), retrying transient errors with exponential backoff and full jitter.
+
+    Attempts and backoff sleeps never run past the current turn's budget.
+    Each attempt goes through the backend's circuit breaker, if it has one.
+    """
+    breaker = circuit_breakers.get(backend)
+    if breaker is not None:
+        func = functools.partial(breaker.call, func)
+    metrics = retry_metrics[backend]
+    metrics["calls"] += 1
+    attempt = 0
+    while True:
+        attempt += 1
+        metrics["attempts"] += 1
+        remaining = remaining_budget()
+        try:
+            if remaining is None:
+                result = await func()
+            elif remaining <= 0:
+                raise BudgetExceeded("This reply ran out of time")
+            else:
+                result = await asyncio.wait_for(func(), remaining)
+        except Exception as e:
+            remaining = remaining_budget()
+            out_of_time = remaining is not None and remaining <= 0
+            delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempt - 1)))
+            if (out_of_time or attempt >= RETRY_MAX_ATTEMPTS or not retryable(e)
+                    or (remaining is not None and delay >= remaining)):
+                metrics["failures"] += 1
+                metrics[f"attempts_{attempt}"] += 1
+                if out_of_time and not isinstance(e, BudgetExceeded):
+                    raise BudgetExceeded("This reply ran out of time") from e
+                raise
+            metrics["retries"] += 1
+            await asyncio.sleep(delay)
+            continue
+        metrics["successes"] += 1
+        metrics[f"attempts_{attempt}"] += 1
+        return result
+
+class TTLCache:
+    """In-process LRU cache with per-entry expiry and an entry/byte budget.
+
+    Entry sizes are estimated from their JSON encoding when they are stored,
+    so values must be JSON serializable.
+    """
+
+    def __init__(self, ttl: float, max_entries: int, max_bytes: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict = OrderedDict()  # key -> (expires_at, size, value)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Any) -> Any:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[2]
+
+    def get_stale(self, key: Any) -> Any:
+        """Return an entry even if it has expired, without touching the counters."""
+        entry = self._entries.get(key)
+        return None if entry is None else entry[2]
+
+    def set(self, key: Any, value: Any, ttl: Optional[float] = None) -> None:
+        size = len(json.dumps(value, default=str))
+        if size > self.max_bytes:
+            return
+        self.pop(key)
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._entries[key] = (expires_at, size, value)
+        self.total_bytes += size
+        while len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes:
+            _, (_, evicted_size, _) = self._entries.popitem(last=False)
+            self.total_bytes -= evicted_size
+            self.evictions += 1
+
+    def pop(self, key: Any) -> Any:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        self.total_bytes -= entry[1]
+        return entry[2]
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.total_bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.total_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+class SQLiteCache:
+    """Persistent cache in a SQLite database, safe to share between processes.
+
+    The database runs in WAL mode so readers in other workers are not blocked
+    by writers. Expired rows are purged and least recently used rows dropped
+    whenever the stored values outgrow max_bytes. Methods block, so call them
+    from a worker thread.
+    """
+
+    COMPACT_EVERY = 50
+
+    def __init__(self, path: str, ttl: float, max_bytes: int):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._writes = 0
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: Any) -> Optional[tuple]:
+        """Return (value, expires_at) for a live entry, or None."""
+        now = time.time()
+        key = json.dumps(key)
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT value, expires_at FROM cache WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+        return json.loads(row[0]), row[1]
+
+    def set(self, key: Any, value: Any, ttl: Optional[float] = None) -> None:
+        now = time.time()
+        data = json.dumps(value, default=str)
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (json.dumps(key), data, len(data), expires_at, now),
+            )
+        self._writes += 1
+        if self._writes % self.COMPACT_EVERY == 0:
+            self.compact()
+
+    def compact(self) -> None:
+        """Drop expired rows, then the least recently used ones until under budget."""
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+            if total > self.max_bytes:
+                excess = total - self.max_bytes
+                stale = []
+                for key, size in conn.execute("SELECT key, size FROM cache ORDER BY accessed_at"):
+                    if excess <= 0:
+                        break
+                    stale.append((key,))
+                    excess -= size
+                conn.executemany("DELETE FROM cache WHERE key = ?", stale)
+
+class SingleFlight:
+    """Share one in-flight call between concurrent callers with the same key.
+
+    The shared task is shielded, so a caller that is cancelled does not
+    cancel the call for everyone else waiting on it.
+    """
+
+    def __init__(self):
+        self.coalesced = 0
+        self._inflight: Dict[Any, asyncio.Future] = {}
+
+    async def do(self, key: Any, func: Callable[[], Any]) -> Any:
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(func())
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(future)
+
+class TieredCache:
+    """An in-memory TTLCache in front of an optional SQLiteCache.
+
+    get() only looks in memory; load() falls back to disk and promotes what it
+    finds. Disk errors are logged and treated as misses.
+    """
+
+    def __init__(self, memory: TTLCache, disk: Optional[SQLiteCache] = None):
+        self.memory = memory
+        self.disk = disk
+
+    def get(self, key: Any) -> Any:
+        return self.memory.get(key)
+
+    async def load(self, key: Any) -> Any:
+        if self.disk is None:
+            return None
+        try:
+            stored = await asyncio.to_thread(self.disk.get, key)
+        except sqlite3.Error as e:
+            log.warning("Cache read error: %s", e)
+            return None
+        if stored is None:
+            return None
+        value, expires_at = stored
+        self.memory.set(key, value, ttl=expires_at - time.time())
+        return value
+
+    async def set(self, key: Any, value: Any) -> None:
+        self.memory.set(key, value)
+        if self.disk is not None:
+            try:
+                await asyncio.to_thread(self.disk.set, key, value)
+            except sqlite3.Error as e:
+                log.warning("Cache write error: %s", e)
+
+def open_disk_cache(path: str, ttl: float, max_bytes: int) -> Optional[SQLiteCache]:
+    """Open a SQLiteCache if a path is configured, or return None."""
+    if not path:
+        return None
+    try:
+        return SQLiteCache(path, ttl, max_bytes)
+    except sqlite3.Error as e:
+        log.warning("Cache database %s unavailable: %s", path, e)
+        return None
+
+search_cache = TieredCache(
+    TTLCache(SEARCH_CACHE_TTL, SEARCH_CACHE_MAX_ENTRIES, SEARCH_CACHE_MAX_BYTES),
+    open_disk_cache(SEARCH_CACHE_DB, SEARCH_CACHE_TTL, SEARCH_CACHE_DB_MAX_BYTES),
+)
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+def search_cache_key(kind: str, query: str, max_results: int) -> tuple:
+    """Cache key for a search: case and whitespace differences share an entry."""
+    return (search_provider.name, kind, normalize_query(query), max_results)
+
+search_flight = SingleFlight()
+
+# DDGS is synchronous, so searches run on a bounded thread pool instead of
+# the event loop. Each worker thread gets its own client.
+search_executor = ThreadPoolExecutor(max_workers=SEARCH_MAX_WORKERS, thread_name_prefix="search")
+_search_local = threading.local()
+
+def get_ddgs() -> "DDGS":
+    """Return the DuckDuckGo client for the current search thread."""
+    client = getattr(_search_local, "ddgs", None)
+    if client is None:
+        from duckduckgo_search import DDGS
+        client = _search_local.ddgs = DDGS()
+    return client
+
+class SearchProvider(Protocol):
+    """Blocking search calls; run_search moves them off the event loop.
+
+    Web results have title, link and snippet keys; video results have
+    title, link, duration and channel.
+    """
+    name: str  # part of every search cache key
+
+    def text(self, query: str, max_results: int) -> List[Dict]: ...
+
+    def videos(self, query: str, max_results: int) -> List[Dict]: ...
+
+class DuckDuckGoProvider:
+    """DuckDuckGo results mapped from its own field names to the provider shape."""
+
+    name = "duckduckgo"
+
+    def text(self, query: str, max_results: int) -> List[Dict]:
+        return [
+            {'title': r.get('title', 'No title'), 'link': r.get('href', 'No link'), 'snippet': r.get('body', '')}
+            for r in get_ddgs().text(query, max_results=max_results)
+        ]
+
+    def videos(self, query: str, max_results: int) -> List[Dict]:
+        return [
+            {
+                'title': r.get('title', 'No title'),
+                'link': r.get('content', 'No link'),
+                'duration': r.get('duration') or 'N/A',
+                'channel': r.get('uploader') or r.get('publisher') or 'N/A',
+            }
+            for r in get_ddgs().videos(query, max_results=max_results)
+        ]
+
+class FixtureProvider:
+    """Serve searches from a JSON lines file of recorded results.
+
+    Each line holds kind ("web" or "videos"), query and results. Queries
+    match like cache keys, ignoring case and spacing, and misses return no
+    results. Every call blocks its search thread for a lognormal delay
+    around latency, seeded by the query so runs repeat. Given a record_from
+    provider, misses are searched there instead and appended to the file.
+    """
+
+    name = "replay"
+
+    def __init__(self, path: str = SEARCH_FIXTURES, latency: float = SEARCH_REPLAY_LATENCY,
+                 sigma: float = SEARCH_REPLAY_LATENCY_SIGMA,
+                 record_from: Optional[SearchProvider] = None):
+        self.path = path
+        self.latency = latency
+        self.sigma = sigma
+        self.record_from = record_from
+        self.fixtures: Dict[tuple, List[Dict]] = {}
+        self.lock = threading.Lock()
+        self.misses = 0
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        row = json.loads(line)
+                        self.fixtures[(row["kind"], normalize_query(row["query"]))] = row["results"]
+
+    def _search(self, kind: str, query: str, max_results: int) -> List[Dict]:
+        key = (kind, normalize_query(query))
+        results = self.fixtures.get(key)
+        if results is None and self.record_from is not None:
+            search = self.record_from.text if kind == "web" else self.record_from.videos
+            results = search(query, max_results)
+            with self.lock:
+                self.fixtures[key] = results
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"kind": kind, "query": query, "results": results}) + "\n")
+            return results[:max_results]
+        if self.latency > 0:
+            rng = random.Random(f"{kind}:{key[1]}")
+            time.sleep(self.latency * math.exp(rng.gauss(0, self.sigma)))
+        if results is None:
+            with self.lock:
+                self.misses += 1
+            return []
+        return results[:max_results]
+
+    def text(self, query: str, max_results: int) -> List[Dict]:
+        return self._search("web", query, max_results)
+
+    def videos(self, query: str, max_results: int) -> List[Dict]:
+        return self._search("videos", query, max_results)
+
+def make_search_provider(name: str = SEARCH_PROVIDER) -> SearchProvider:
+    if name == "duckduckgo":
+        return DuckDuckGoProvider()
+    if name == "replay":
+        return FixtureProvider()
+    if name == "record":
+        return FixtureProvider(latency=0, record_from=DuckDuckGoProvider())
+    raise ValueError(f"Unknown SEARCH_PROVIDER: {name}")
+
+search_provider: SearchProvider = make_search_provider()
+
+async def run_search(func: Callable[..., Any], *args: Any, timeout: float = SEARCH_TIMEOUT) -> Any:
+    """Run a blocking search call on the search pool with a timeout.
+
+    If the awaiting task is cancelled (e.g. the user disconnects) we stop
+    waiting right away; the worker thread finishes its request on its own.
+    """
+    loop = asyncio.get_running_loop()
+    timer = queued_call_timer()
+
+    def work() -> Any:
+        timer.start()
+        return func(*args)
+
+    future = loop.run_in_executor(search_executor, work)
+    return await asyncio.wait_for(future, timeout)
+
+def _fetch_web(query: str, max_results: int) -> List[Dict]:
+    return search_provider.text(query, max_results)
+
+def _fetch_videos(query: str, max_results: int) -> List[Dict]:
+    return search_provider.videos(query, max_results)
+
+async def cached_search(kind: str, query: str, max_results: int, search: Callable) -> List[Dict]:
+    """Serve a search from the cache, falling back to the given search function.
+
+    Memory misses check the on-disk cache (when configured) before searching,
+    and concurrent misses for the same key share a single lookup. Empty
+    results are not cached since they usually mean the search failed; while
+    the search breaker is open an expired cached result is served instead.
+    """
+    key = search_cache_key(kind, query, max_results)
+    cached = search_cache.get(key)
+    if cached is not None:
+        return list(cached)
+
+    async def fetch() -> List[Dict]:
+        results = await search_cache.load(key)
+        if results is None:
+            results = await search(query, max_results)
+            if results:
+                await search_cache.set(key, results)
+            elif circuit_breakers["duckduckgo"].state == CircuitBreaker.OPEN:
+                # DuckDuckGo is failing fast; an expired result beats none
+                results = search_cache.memory.get_stale(key) or []
+        return results
+
+    return list(await search_flight.do(key, fetch))
 
 async def search_web(query: str, max_results: int = 3) -> List[Dict]:
     """Perform web search and return results."""
+    return await cached_search("web", query, max_results, _search_web)
+
+async def search_youtube(query: str, max_results: int = 3) -> List[Dict]:
+    """Search YouTube videos and return results."""
+    return await cached_search("videos", query, max_results, _search_youtube)
+
+async def _search_web(query: str, max_results: int) -> List[Dict]:
     try:
         results = []
-        for r in ddgs.text(query, max_results=max_results):
+        search_results = await call_with_retries(
+            "duckduckgo", lambda: run_search(_fetch_web, query, max_results)
+        )
+        for r in search_results:
             results.append({
                 'title': r['title'],
                 'link': r['link'],
-                'snippet': r['body']
+                'snippet': r['snippet']
             })
         return results
     except Exception as e:
-        print(f"Search error: {str(e)}")
+        log.warning("Search error: %s", e)
         return []
 
-async def search_youtube(query: str, max_results: int = 3) -> List[Dict]:
-    """Search YouTube videos and return results."""
+async def _search_youtube(query: str, max_results: int) -> List[Dict]:
     try:
-        print(f"Starting YouTube search for: {query}")  # Debug log
+        log.debug("Starting YouTube search for: %s", query)
         results = []
-        search_results = list(ddgs.videos(query, max_results=max_results))
-        print(f"Found {len(search_results)} results")  # Debug log
+        search_results = await call_with_retries(
+            "duckduckgo", lambda: run_search(_fetch_videos, query, max_results)
+        )
+        log.debug("Found %d results", len(search_results))
         
         for r in search_results:
             try:
@@ -66,159 +880,1218 @@ async def search_youtube(query: str, max_results: int = 3) -> List[Dict]:
                     'duration': r.get('duration', 'N/A'),
                     'channel': r.get('channel', 'N/A')
                 }
-                print(f"Processed result: {result['title']}")  # Debug log
+                log.debug("Processed result: %s", result['title'])
                 results.append(result)
             except Exception as e:
-                print(f"Error processing result: {str(e)}")  # Debug log
+                log.debug("Error processing result: %s", e)
                 continue
                 
         return results
     except Exception as e:
-        print(f"YouTube search error: {str(e)}")  # Debug log
-        print(f"Error type: {type(e)}")  # Debug log
+        log.warning("YouTube search error: %s", e, extra={"error_type": type(e).__name__})
         return []
 
-# Store user preferences and responses
-user_data: UserData = {
-    "current_habits": [],
-    "energizing_activities": [],
-    "goals": [],
-    "conversation_history": []
+COMBINED_SEARCH_DEADLINE = float(os.getenv('COMBINED_SEARCH_DEADLINE', '6'))
+# Generic video search used when a specific one comes back empty
+VIDEO_FALLBACK_QUERY = "morning routine motivation"
+# Web search used when a request names no topic
+WEB_DEFAULT_QUERY = "morning routine tips"
+# Seconds to wait on a video search before starting the fallback alongside it
+VIDEO_HEDGE_DELAY = float(os.getenv('VIDEO_HEDGE_DELAY', '1.5'))
+
+async def search_youtube_hedged(query: str, max_results: int = 3, delay: float = VIDEO_HEDGE_DELAY) -> tuple:
+    """Search YouTube, falling back to the generic query when nothing is found.
+
+    If the search is still running after delay seconds, the fallback search
+    starts alongside it so it is ready if needed, but its results are only
+    used once the specific search has come back empty (which includes
+    errors and timeouts). Returns (results, used_fallback).
+    """
+    if search_cache_key("videos", query, max_results) == search_cache_key("videos", VIDEO_FALLBACK_QUERY, max_results):
+        return await search_youtube(query, max_results), False
+    primary = asyncio.ensure_future(search_youtube(query, max_results))
+    fallback = None
+    try:
+        done, _ = await asyncio.wait([primary], timeout=delay)
+        if not done:
+            fallback = asyncio.ensure_future(search_youtube(VIDEO_FALLBACK_QUERY, max_results))
+        results = await primary
+        if results:
+            return results, False
+        if fallback is None:
+            fallback = asyncio.ensure_future(search_youtube(VIDEO_FALLBACK_QUERY, max_results))
+        return await fallback, True
+    finally:
+        for task in (primary, fallback):
+            if task is not None and not task.done():
+                task.cancel()
+
+def format_video(result: Dict) -> str:
+    return (
+        f"📺 {result['title']}\n"
+        f"🔗 {result['link']}\n"
+        f"⏱️ Duration: {result['duration']}\n"
+        f"👤 Channel: {result['channel']}\n\n"
+    )
+
+def format_web(result: Dict) -> str:
+    return (
+        f"📚 {result['title']}\n"
+        f"🔗 {result['link']}\n"
+        f"📝 {result['snippet'][:200]}...\n\n"
+    )
+
+# Query words that say nothing about a result's topic
+_RANKING_STOP_WORDS = frozenset(
+    "a an the to i my me some any about for of on in with and or is are be it "
+    "how what can you your".split()
+)
+
+def merge_results(query: str, web: List[Dict], videos: List[Dict]) -> List[Dict]:
+    """Interleave web and video results, ranked by how many query words they share.
+
+    Each result gains a "kind" key ("web" or "video"); duplicate links are dropped.
+    """
+    terms = set(re.findall(r"[a-z0-9']+", query.lower())) - _RANKING_STOP_WORDS
+    scored = []
+    for kind, results in (("web", web), ("video", videos)):
+        for rank, result in enumerate(results):
+            text = f"{result.get('title', '')} {result.get('snippet', '')}".lower()
+            overlap = len(terms & set(re.findall(r"[a-z0-9']+", text))) / len(terms) if terms else 0.0
+            # Upstream order breaks ties, so each backend's best hit comes first
+            scored.append((overlap + 1.0 / (rank + 2), {**result, "kind": kind}))
+    scored.sort(key=lambda item: item[0], reverse=True)
+    merged, seen = [], set()
+    for _, result in scored:
+        if result["link"] not in seen:
+            seen.add(result["link"])
+            merged.append(result)
+    return merged
+
+async def search_all(query: str, max_results: int = 3, deadline: float = COMBINED_SEARCH_DEADLINE) -> List[Dict]:
+    """Search the web and YouTube at once and merge what arrives before the deadline.
+
+    A search still running at the deadline is left to finish in the
+    background, so its results land in the cache for next time.
+    """
+    remaining = remaining_budget()
+    if remaining is not None:
+        deadline = max(0.0, min(deadline, remaining))
+    web_task = asyncio.ensure_future(search_web(query, max_results))
+    video_task = asyncio.ensure_future(search_youtube(query, max_results))
+    await asyncio.wait([web_task, video_task], timeout=deadline)
+
+    def collect(task: asyncio.Task) -> List[Dict]:
+        if not task.done():
+            task.cancel()
+            return []
+        return task.result()
+
+    return merge_results(query, collect(web_task), collect(video_task))
+
+# Message routing
+INTENT_VIDEO = "video"
+INTENT_WEB = "web"
+INTENT_ALL = "all"
+
+# Routing keywords and reading material words. A plain alternation lets
+# the regex engine skip ahead by first letter, which a leading \b would
+# prevent, so word boundaries are checked on the matches instead.
+_ROUTING_PATTERN = re.compile(
+    r"youtube|videos?|watch|search|find|look for"
+    r"|articles?|blog posts?|blogs?|websites?|web results|web"
+)
+_ROUTING_VIDEO, _ROUTING_WEB, _ROUTING_READING = range(3)
+_ROUTING_KINDS = {
+    "youtube": _ROUTING_VIDEO, "video": _ROUTING_VIDEO, "videos": _ROUTING_VIDEO, "watch": _ROUTING_VIDEO,
+    "search": _ROUTING_WEB, "find": _ROUTING_WEB, "look for": _ROUTING_WEB,
 }
+# The "and"/"or" (and "the") joining reading material to the rest
+_JOINER_BEFORE = re.compile(r"(?:\b(?:and|or)\s+)?(?:\bthe\s+)?$")
+_JOINER_AFTER = re.compile(r"\s+(?:and|or)\b")
+
+def _is_word_char(char: str) -> bool:
+    """Whether char (one character, or "" past either end) is a regex word character."""
+    return char.isalnum() or char == "_"
+
+def route_message(content: str) -> tuple:
+    """Return (intent, query) for a lowercased message.
+
+    The intent is INTENT_VIDEO, INTENT_WEB, INTENT_ALL (videos and reading
+    material) or None, and the query is the message with the routing
+    keywords removed. The message is scanned once, and the query is cut
+    from the spans of that scan. Reading material words only matter
+    alongside a video request, and are cut with their joining words.
+    """
+    match = _ROUTING_PATTERN.search(content)
+    if match is None:
+        return None, content
+    # Most messages have no keyword; for the rest, the scan picks up where the search stopped
+    spans: tuple = ([], [], [])
+    for match in _ROUTING_PATTERN.finditer(content, match.start()):
+        begin, end = match.span()
+        if _is_word_char(content[begin - 1:begin]) or _is_word_char(content[end:end + 1]):
+            continue
+        spans[_ROUTING_KINDS.get(match.group(), _ROUTING_READING)].append((begin, end))
+    video, web, reading = spans
+    if video:
+        intent = INTENT_ALL if reading else INTENT_VIDEO
+        cut = video + web
+        for begin, end in reading:
+            joiner = _JOINER_AFTER.match(content, end)
+            cut.append((_JOINER_BEFORE.search(content, 0, begin).start(), joiner.end() if joiner else end))
+        cut.sort()
+    elif web:
+        intent, cut = INTENT_WEB, web
+    else:
+        return None, content
+    pieces, start = [], 0
+    for begin, end in cut:
+        pieces.append(content[start:begin])
+        start = max(start, end)
+    pieces.append(content[start:])
+    return intent, " ".join(" ".join(pieces).split())
+
+# Local intent classifier, trained on first use from a bundled corpus
+INTENT_CLASSIFIER_ENABLED = os.getenv('INTENT_CLASSIFIER_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+INTENT_CORPUS = os.getenv(
+    'INTENT_CORPUS', os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "intent_corpus.jsonl")
+)
+# Below this confidence the keyword rules decide
+INTENT_CONFIDENCE = float(os.getenv('INTENT_CONFIDENCE', '0.6'))
+
+# Classifier labels; "routine" and "chat" both go on to the conversation flow
+CLASSIFIER_INTENTS = {"video": INTENT_VIDEO, "web": INTENT_WEB, "routine": None, "chat": None}
+
+class IntentClassifier:
+    """Softmax regression over hashed word unigrams and bigrams."""
+
+    DIM = 1 << 14
+
+    def __init__(self, labels: List[str]):
+        self.labels = labels
+        self.weights = [[0.0] * self.DIM for _ in labels]
+
+    @classmethod
+    def features(cls, text: str) -> List[int]:
+        words = re.findall(r"[a-z0-9']+", text.lower())
+        grams = ["<bias>"] + words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        return [zlib.crc32(gram.encode()) % cls.DIM for gram in grams]
+
+    def probabilities(self, features: List[int]) -> List[float]:
+        scores = [sum(w[i] for i in features) for w in self.weights]
+        top = max(scores)
+        exps = [math.exp(score - top) for score in scores]
+        total = sum(exps)
+        return [e / total for e in exps]
+
+    def train(self, examples: List[tuple], epochs: int = 30, learning_rate: float = 0.5) -> None:
+        """Fit on (text, label) pairs with plain SGD; a fixed seed keeps it deterministic."""
+        data = [(self.features(text), self.labels.index(label)) for text, label in examples]
+        rng = random.Random(0)
+        for _ in range(epochs):
+            rng.shuffle(data)
+            for features, target in data:
+                for k, p in enumerate(self.probabilities(features)):
+                    step = learning_rate * ((1.0 if k == target else 0.0) - p)
+                    for i in features:
+                        self.weights[k][i] += step
+
+    def predict(self, text: str) -> tuple:
+        """Return (label, confidence) for a message."""
+        probabilities = self.probabilities(self.features(text))
+        best = max(range(len(self.labels)), key=probabilities.__getitem__)
+        return self.labels[best], probabilities[best]
+
+    @classmethod
+    def from_corpus(cls, path: str) -> "IntentClassifier":
+        with open(path, encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+        classifier = cls(sorted({row["label"] for row in rows}))
+        classifier.train([(row["text"], row["label"]) for row in rows])
+        return classifier
+
+_intent_classifier: Optional[IntentClassifier] = None
+_intent_classifier_failed = False
+_intent_classifier_lock = threading.Lock()
+
+_intent_classifier_task: Optional[asyncio.Task] = None
+
+def get_intent_classifier() -> Optional[IntentClassifier]:
+    """Train the classifier on first use; None if it is disabled or unavailable.
+
+    Training blocks for tens of milliseconds, so async code should use
+    load_intent_classifier() instead.
+    """
+    global _intent_classifier, _intent_classifier_failed
+    if _intent_classifier is None and INTENT_CLASSIFIER_ENABLED and not _intent_classifier_failed:
+        with _intent_classifier_lock:
+            if _intent_classifier is None and not _intent_classifier_failed:
+                try:
+                    _intent_classifier = IntentClassifier.from_corpus(INTENT_CORPUS)
+                except (OSError, ValueError, KeyError) as e:
+                    log.warning("Intent classifier unavailable, using keyword routing: %s", e)
+                    _intent_classifier_failed = True
+    return _intent_classifier
+
+def load_intent_classifier() -> asyncio.Task:
+    """Start training the classifier in a worker thread, once; the task returns it."""
+    global _intent_classifier_task
+    if _intent_classifier_task is None:
+        _intent_classifier_task = run_in_background(asyncio.to_thread(get_intent_classifier))
+    return _intent_classifier_task
+
+def classify_message(content: str) -> tuple:
+    """Return (intent, query) like route_message, letting the classifier decide when it is confident.
+
+    Never trains the classifier: until it is ready, the keyword rules decide.
+    """
+    intent, query = route_message(content)
+    classifier = _intent_classifier
+    if classifier is None:
+        return intent, query
+    label, confidence = classifier.predict(content)
+    if confidence < INTENT_CONFIDENCE:
+        return intent, query
+    classified = CLASSIFIER_INTENTS.get(label)
+    # The classifier has no combined label; keep an explicit request for both
+    if intent == INTENT_ALL and classified is not None:
+        return intent, query
+    return classified, query
+
+# Store user preferences and responses per chat session
+SESSION_IDLE_TIMEOUT = float(os.getenv('SESSION_IDLE_TIMEOUT', '3600'))
+SESSION_MAX = int(os.getenv('SESSION_MAX', '10000'))
+HISTORY_WINDOW = int(os.getenv('HISTORY_WINDOW', '10'))
+# Directory that turns falling out of the history window are appended to;
+# empty keeps nothing beyond the window
+HISTORY_SPILL_DIR = os.getenv('HISTORY_SPILL_DIR', '')
+# Fold turns that leave the window into a running summary in the background
+SUMMARY_ENABLED = os.getenv('SUMMARY_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+SUMMARY_DEBOUNCE = float(os.getenv('SUMMARY_DEBOUNCE', '5'))
+SUMMARY_MAX_WORDS = int(os.getenv('SUMMARY_MAX_WORDS', '150'))
+
+# A single thread keeps each session's spilled turns in order
+_spill_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-spill")
+
+def _write_spilled_turn(path: str, role: str, content: str, timestamp: float) -> None:
+    try:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"role": role, "content": content, "timestamp": timestamp}) + "\n")
+    except OSError as e:
+        log.warning("History spill error: %s", e)
+
+def spill_to_disk(session_id: str) -> Callable[[HistoryRecord], None]:
+    """Eviction callback appending a session's old turns to a JSON lines file."""
+    path = os.path.join(HISTORY_SPILL_DIR, f"{session_id}.jsonl")
+
+    def spill(record: HistoryRecord) -> None:
+        _spill_executor.submit(_write_spilled_turn, path, record.role, record.content, record.timestamp)
+
+    return spill
+
+class RollingSummary:
+    """Running summary of the turns that have left the history window.
+
+    Evicted turns are queued and folded into the summary by a background
+    task once no new turn has arrived for SUMMARY_DEBOUNCE seconds, so
+    summarizing never adds latency to a reply.
+    """
+
+    __slots__ = ("text", "_pending", "_last_added", "_task")
+
+    def __init__(self):
+        self.text = ""
+        self._pending: List[HistoryRecord] = []
+        self._last_added = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def add(self, record: HistoryRecord) -> None:
+        self._pending.append(record)
+        self._last_added = time.monotonic()
+        if self._task is None or self._task.done():
+            self._task = run_in_background(self._compact_when_quiet())
+
+    async def _compact_when_quiet(self) -> None:
+        turn_deadline.set(None)  # background work isn't bound by the user's turn
+        while self._pending:
+            delay = self._last_added + SUMMARY_DEBOUNCE - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            turns, self._pending = self._pending, []
+            summary = await summarize_turns(self.text, turns)
+            if is_error_reply(summary):
+                # Keep the turns for the next attempt, which the next eviction starts
+                self._pending[:0] = turns
+                return
+            self.text = summary.strip()
+
+    def close(self) -> None:
+        """Drop queued turns and stop the background task, for a session that has ended."""
+        self._pending = []
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+
+async def summarize_turns(summary: str, turns: List[HistoryRecord]) -> str:
+    transcript = "\n".join(f"{turn.role}: {turn.content}" for turn in turns)
+    return await get_gemini_response(
+        f"Rewrite the summary so it also covers these turns, in at most {SUMMARY_MAX_WORDS} words. "
+        "Keep facts about the user's habits, preferences and decisions.",
+        f"Summary so far: {summary or 'none'}\n\nEarlier turns:\n{transcript}",
+        priority=PRIORITY_BACKGROUND
+    )
+
+def new_user_data(session_id: str) -> UserData:
+    summary = RollingSummary()
+    evict_handlers = [summary.add] if SUMMARY_ENABLED else []
+    if HISTORY_SPILL_DIR:
+        evict_handlers.append(spill_to_disk(session_id))
+    return {
+        "current_habits": [],
+        "energizing_activities": [],
+        "goals": [],
+        "conversation_history": ConversationHistory(HISTORY_WINDOW, evict_handlers),
+        "summary": summary
+    }
+
+class SessionStore:
+    """User data for each chat session, created the first time it is needed.
+
+    on_chat_end discards a session's data. Sessions idle for longer than
+    idle_timeout are dropped too, in case an end is missed, and the least
+    recently used ones go first when more than max_sessions are live.
+    """
+
+    def __init__(self, idle_timeout: float, max_sessions: int):
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self.evictions = 0
+        self._sessions: OrderedDict = OrderedDict()  # session id -> (last_used, UserData)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def get(self, session_id: str) -> UserData:
+        now = time.monotonic()
+        entry = self._sessions.pop(session_id, None)
+        data = new_user_data(session_id) if entry is None else entry[1]
+        self._sessions[session_id] = (now, data)
+        # Entries are ordered by last use, so only the oldest need checking
+        while self._sessions:
+            last_used, _ = next(iter(self._sessions.values()))
+            if len(self._sessions) <= self.max_sessions and now - last_used <= self.idle_timeout:
+                break
+            _, (_, evicted) = self._sessions.popitem(last=False)
+            evicted["summary"].close()
+            self.evictions += 1
+        return data
+
+    def discard(self, session_id: str) -> None:
+        entry = self._sessions.pop(session_id, None)
+        if entry is not None:
+            entry[1]["summary"].close()
+
+sessions = SessionStore(SESSION_IDLE_TIMEOUT, SESSION_MAX)
+
+def get_user_data() -> UserData:
+    """Return the current chat session's user data."""
+    return sessions.get(cl.context.session.id)
+
+STARTER_ROUTINE = "Can you help me create a personalized morning routine that would help increase my productivity throughout the day? Start by asking me about my current habits and what activities energize me in the morning."
+STARTER_VIDEO = "Find me a motivational morning routine video on YouTube."
+STARTER_WEB = "Find me some morning routine tips and articles."
+
+ROUTINE_OPENER_PROMPT = "Start a conversation about creating a morning routine. Ask about current habits."
+ROUTINE_OPENER_CONTEXT = "You are a morning routine expert. Start by asking about the user's current morning habits."
+
+# Warm the caches behind the starters at startup and refresh them periodically
+WARMUP_ENABLED = os.getenv('WARMUP_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+WARMUP_INTERVAL = float(os.getenv('WARMUP_INTERVAL', '1800'))
+
+_warmup_task: Optional[asyncio.Task] = None
+
+def warmup_searches() -> List[tuple]:
+    """(kind, query) of the searches the search starters lead to."""
+    searches = [("videos", VIDEO_FALLBACK_QUERY)]
+    for starter in (STARTER_VIDEO, STARTER_WEB):
+        intent, query = classify_message(starter.lower())
+        if intent == INTENT_VIDEO:
+            searches.append(("videos", query or VIDEO_FALLBACK_QUERY))
+        elif intent == INTENT_WEB:
+            searches.append(("web", query or WEB_DEFAULT_QUERY))
+    return searches
+
+async def warm_search(kind: str, query: str, refresh: bool) -> None:
+    key = search_cache_key(kind, query, 3)
+    if not refresh and (search_cache.get(key) is not None or await search_cache.load(key) is not None):
+        return
+    search = _search_youtube if kind == "videos" else _search_web
+    results = await search(query, 3)
+    if results:
+        await search_cache.set(key, results)
+
+async def warm_caches(refresh: bool = False) -> None:
+    """Fill the starter caches, or with refresh, fetch fresh copies."""
+    # Train the classifier off the event loop before routing the starters
+    await load_intent_classifier()
+    jobs = [warm_search(kind, query, refresh) for kind, query in warmup_searches()]
+    jobs.append(get_gemini_response(
+        ROUTINE_OPENER_PROMPT, ROUTINE_OPENER_CONTEXT, use_cache=not refresh, priority=PRIORITY_BACKGROUND
+    ))
+    for result in await asyncio.gather(*jobs, return_exceptions=True):
+        if isinstance(result, Exception):
+            log.warning("Warmup error: %s", result)
+
+async def run_warmup() -> None:
+    turn_deadline.set(None)  # background work isn't bound by a user's turn
+    refresh = False
+    while True:
+        await warm_caches(refresh)
+        refresh = True
+        await asyncio.sleep(WARMUP_INTERVAL)
+
+def ensure_warmup() -> None:
+    """Start the warmup loop once per process."""
+    global _warmup_task
+    if WARMUP_ENABLED and _warmup_task is None:
+        _warmup_task = run_in_background(run_warmup())
 
 @cl.set_starters
 async def set_starters():
+    load_intent_classifier()
+    ensure_warmup()
     return [
         cl.Starter(
             label="Morning routine ideation",
-            message="Can you help me create a personalized morning routine that would help increase my productivity throughout the day? Start by asking me about my current habits and what activities energize me in the morning.",
+            message=STARTER_ROUTINE,
             icon="/public/idea.svg",
             ),
         cl.Starter(
             label="Search YouTube",
-            message="Find me a motivational morning routine video on YouTube.",
+            message=STARTER_VIDEO,
             icon="/public/video.svg",
             ),
         cl.Starter(
             label="Search Web",
-            message="Find me some morning routine tips and articles.",
+            message=STARTER_WEB,
             icon="/public/search.svg",
             )
         ]
 
 @cl.on_chat_start
 async def on_chat_start():
+    load_intent_classifier()
+    ensure_warmup()
     await cl.Message(content="Hello! I'm your morning routine assistant powered by Gemini AI. I can help you create a morning routine, search for videos, and find helpful articles. How can I help you today?").send()
 
-async def get_gemini_response(prompt: str, context: str = "") -> str:
-    """Get response from Gemini model with context."""
-    try:
-        # Prepare the full prompt with context
-        full_prompt = f"{context}\n\nUser: {prompt}\nAssistant:"
-        
-        # Generate response with safety settings
+@cl.on_chat_end
+async def on_chat_end():
+    # Stop any search or generation still running for a user who disconnected
+    task = getattr(cl.context.session, "current_task", None)
+    if task and not task.done() and task is not asyncio.current_task():
+        task.cancel()
+    # Chainlit has dropped the session, so its user data can go too
+    sessions.discard(cl.context.session.id)
+
+SAFETY_SETTINGS = [
+    {
+        "category": "HARM_CATEGORY_HARASSMENT",
+        "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+    },
+    {
+        "category": "HARM_CATEGORY_HATE_SPEECH",
+        "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+    },
+    {
+        "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
+        "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+    },
+    {
+        "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
+        "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+    }
+]
+
+# Admission priorities; lower values are admitted first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+
+class AdmissionTimeout(asyncio.TimeoutError):
+    """Raised when a request waits in the admission queue past its deadline."""
+
+class TokenBucket:
+    """Budget that refills continuously at a per-minute rate (0 means unlimited)."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.available = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.capacity / 60)
+        self.updated = now
+
+    def delay_for(self, amount: float, now: float) -> float:
+        """Seconds until amount can be taken; requests above capacity wait for a full bucket."""
+        if not self.capacity:
+            return 0.0
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.available
+        return max(0.0, missing * 60 / self.capacity)
+
+    def take(self, amount: float) -> None:
+        if self.capacity:
+            self.available -= min(amount, self.capacity)
+
+class AdmissionController:
+    """Bounds concurrent Gemini calls and keeps them within per-minute quotas.
+
+    Waiters are admitted in priority order (FIFO within a priority) once a
+    slot is free and both the request and token buckets can cover them.
+    """
+
+    def __init__(self, max_in_flight: int, requests_per_minute: float, tokens_per_minute: float):
+        self.max_in_flight = max_in_flight
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.in_flight = 0
+        self.admitted = 0
+        self.timeouts = 0
+        self.wait_times: deque = deque(maxlen=1000)
+        self._waiters: List[tuple] = []  # heap of (priority, seq, tokens, future)
+        self._seq = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(1 for *_, future in self._waiters if not future.done())
+
+    @contextlib.asynccontextmanager
+    async def slot(self, tokens: int, priority: int = PRIORITY_INTERACTIVE, timeout: float = LLM_QUEUE_TIMEOUT):
+        """Wait for admission, hold a slot for the body, then release it."""
+        start = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), tokens, future))
+        self._dispatch()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                self._release()  # admitted just as we gave up
+            future.cancel()
+            if isinstance(e, asyncio.TimeoutError):
+                self.timeouts += 1
+                raise AdmissionTimeout(f"Gemini is busy, no capacity within {timeout:g}s") from None
+            raise
+        self.admitted += 1
+        self.wait_times.append(time.monotonic() - start)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _release(self) -> None:
+        self.in_flight -= 1
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        now = time.monotonic()
+        while self._waiters:
+            _, _, tokens, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            if self.in_flight >= self.max_in_flight:
+                return
+            delay = max(self.requests.delay_for(1, now), self.tokens.delay_for(tokens, now))
+            if delay > 0:
+                if self._timer is not None:
+                    self._timer.cancel()
+                self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+                return
+            heapq.heappop(self._waiters)
+            self.requests.take(1)
+            self.tokens.take(tokens)
+            self.in_flight += 1
+            future.set_result(None)
+
+    def stats(self) -> Dict[str, Any]:
+        waits = sorted(self.wait_times)
+        return {
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "admitted": self.admitted,
+            "timeouts": self.timeouts,
+            "wait_avg": sum(waits) / len(waits) if waits else 0.0,
+            "wait_p95": waits[int(len(waits) * 0.95)] if waits else 0.0,
+            "wait_max": waits[-1] if waits else 0.0,
+        }
+
+llm_admission = AdmissionController(LLM_MAX_IN_FLIGHT, LLM_REQUESTS_PER_MINUTE, LLM_TOKENS_PER_MINUTE)
+
+def admission_timeout() -> float:
+    """Queue deadline for a Gemini call, capped by the turn's remaining budget."""
+    remaining = remaining_budget()
+    return LLM_QUEUE_TIMEOUT if remaining is None else max(0.0, min(LLM_QUEUE_TIMEOUT, remaining))
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+def estimate_tokens(text: str) -> int:
+    """Local token count estimate: a token per punctuation mark and per ~4 letters of a word."""
+    return sum((len(token) + 3) // 4 for token in _TOKEN_PATTERN.findall(text))
+
+def estimate_request_tokens(full_prompt: str) -> int:
+    """Token cost charged for a call: the prompt plus the expected reply."""
+    return llm_backend.count_tokens(full_prompt) + LLM_EXPECTED_OUTPUT_TOKENS
+
+class ContextField:
+    """A labelled list of items for build_context.
+
+    Fields with a lower priority number are packed first. When the budget
+    runs out part way through a field, the first items are kept, or the
+    last ones with keep_latest.
+    """
+
+    __slots__ = ("label", "items", "separator", "priority", "keep_latest")
+
+    def __init__(self, label: str, items: List[str], separator: str = ", ",
+                 priority: int = 0, keep_latest: bool = False):
+        self.label = label
+        self.items = [item for item in items if item]
+        self.separator = separator
+        self.priority = priority
+        self.keep_latest = keep_latest
+
+def build_context(fields: List[ContextField], budget: int = CONTEXT_TOKEN_BUDGET) -> str:
+    """Render fields as "label: items" lines, keeping the estimate within budget.
+
+    Fields are packed by priority but rendered in the order given; fields
+    with no items, or none that fit, are left out.
+    """
+    packed: Dict[int, List[str]] = {}
+    remaining = budget
+    for index in sorted(range(len(fields)), key=lambda i: fields[i].priority):
+        field = fields[index]
+        cost = estimate_tokens(field.label) + 1
+        if not field.items or cost >= remaining:
+            continue
+        remaining -= cost
+        kept = []
+        for item in (reversed(field.items) if field.keep_latest else field.items):
+            item_cost = estimate_tokens(item) + 1
+            if item_cost > remaining:
+                break
+            kept.append(item)
+            remaining -= item_cost
+        if not kept:
+            remaining += cost
+            continue
+        packed[index] = kept[::-1] if field.keep_latest else kept
+    lines = []
+    for index, field in enumerate(fields):
+        if index in packed:
+            # Multi-line fields start on the line after their label
+            gap = "\n" if "\n" in field.separator else " "
+            lines.append(f"{field.label}:{gap}{field.separator.join(packed[index])}")
+    return "\n".join(lines)
+
+def preference_fields(user_data: UserData) -> List[ContextField]:
+    return [
+        ContextField("User's current habits", user_data["current_habits"]),
+        ContextField("Energizing activities", user_data["energizing_activities"]),
+        ContextField("Goals", user_data["goals"]),
+    ]
+
+def render_history(records: List[HistoryRecord]) -> List[str]:
+    """Compact "role: content" lines for prompts."""
+    return [f"{record.role}: {' '.join(record.content.split())}" for record in records]
+
+def followup_context(user_data: UserData, budget: int = CONTEXT_TOKEN_BUDGET) -> str:
+    """Context for a free-form question: preferences, then the newest turns, then the summary.
+
+    The newest turn is the question itself, which goes in the prompt.
+    """
+    history = user_data["conversation_history"]
+    return build_context(preference_fields(user_data) + [
+        ContextField("Summary of earlier conversation", [user_data["summary"].text], priority=2),
+        ContextField("Previous conversation", render_history(history.recent(len(history))[:-1]),
+                     separator="\n", priority=1, keep_latest=True),
+    ], budget)
+
+ERROR_REPLY = "I apologize, but I encountered an error"
+
+def is_error_reply(text: str) -> bool:
+    return text.startswith(ERROR_REPLY)
+
+def build_prompt(prompt: str, context: str = "") -> str:
+    """Combine the context and the user's prompt into the full model prompt."""
+    return f"{context}\n\nUser: {prompt}\nAssistant:"
+
+class LLMBackend(Protocol):
+    """What the bot needs from a language model."""
+    name: str  # part of every response cache key
+
+    async def generate(self, prompt: str) -> str: ...
+
+    def stream(self, prompt: str) -> AsyncIterator[str]: ...
+
+    def count_tokens(self, text: str) -> int: ...
+
+class GeminiBackend:
+    """Gemini through google.generativeai, with the bot's safety settings."""
+
+    def __init__(self, model_name: str = GEMINI_MODEL):
+        self.name = model_name
+
+    async def generate(self, prompt: str) -> str:
+        model = await load_model()
         response = await model.generate_content_async(
-            full_prompt,
-            safety_settings=[
-                {
-                    "category": "HARM_CATEGORY_HARASSMENT",
-                    "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-                },
-                {
-                    "category": "HARM_CATEGORY_HATE_SPEECH",
-                    "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-                },
-                {
-                    "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                    "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-                },
-                {
-                    "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
-                    "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-                }
-            ]
+            prompt,
+            safety_settings=SAFETY_SETTINGS,
+            generation_config=GENERATION_CONFIG or None
         )
         return response.text
-    except Exception as e:
-        error_message = f"I apologize, but I encountered an error: {str(e)}"
-        print(f"Gemini API Error: {str(e)}")  # Log the error for debugging
-        return error_message
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        model = await load_model()
+        response = await model.generate_content_async(
+            prompt,
+            safety_settings=SAFETY_SETTINGS,
+            generation_config=GENERATION_CONFIG or None,
+            stream=True
+        )
+        async for chunk in response:
+            if chunk.text:
+                yield chunk.text
+
+    def count_tokens(self, text: str) -> int:
+        # The count_tokens API costs a round trip per call; admission only
+        # needs an estimate
+        return estimate_tokens(text)
+
+class ServiceUnavailable(Exception):
+    """Injected FakeBackend failure, named like the API error so it is retried."""
+
+_FAKE_WORDS = (
+    "wake stretch water sunlight walk breathe plan journal breakfast focus "
+    "move rest calm energy habit minutes start gently slowly today"
+).split()
+
+class FakeBackend:
+    """Offline stand-in for Gemini with repeatable latency, speed and failures.
+
+    Each call draws its time to first token from a lognormal distribution
+    around latency, then produces output_tokens at tokens_per_second. A
+    share of calls (error_rate) fail with ServiceUnavailable before the
+    first token. Draws are seeded by the prompt and how often it has been
+    asked, so a run gives the same replies and timings however its calls
+    interleave. Ask counts are kept by prompt digest for the most recent
+    max_prompts prompts only, so the fake does not grow with a long run.
+    """
+
+    name = "fake"
+
+    def __init__(self, latency: float = FAKE_LLM_LATENCY, sigma: float = FAKE_LLM_LATENCY_SIGMA,
+                 tokens_per_second: float = FAKE_LLM_TOKENS_PER_SECOND,
+                 output_tokens: int = FAKE_LLM_OUTPUT_TOKENS,
+                 error_rate: float = FAKE_LLM_ERROR_RATE, seed: int = FAKE_LLM_SEED,
+                 max_prompts: int = 4096):
+        self.latency = latency
+        self.sigma = sigma
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+        self.error_rate = error_rate
+        self.seed = seed
+        self.max_prompts = max_prompts
+        self.calls: OrderedDict = OrderedDict()  # prompt digest -> times asked
+
+    def _start(self, prompt: str) -> random.Random:
+        key = hashlib.sha256(prompt.encode()).digest()
+        count = self.calls.pop(key, 0) + 1
+        self.calls[key] = count
+        if len(self.calls) > self.max_prompts:
+            self.calls.popitem(last=False)
+        return random.Random(hashlib.sha256(f"{self.seed}:{count}:".encode() + key).digest())
+
+    async def _first_token(self, rng: random.Random) -> None:
+        failed = rng.random() < self.error_rate
+        delay = self.latency * math.exp(rng.gauss(0, self.sigma)) if self.latency > 0 else 0
+        await asyncio.sleep(delay)
+        if failed:
+            raise ServiceUnavailable("fake backend: injected failure")
+
+    def _words(self, rng: random.Random) -> List[str]:
+        return [rng.choice(_FAKE_WORDS) for _ in range(self.output_tokens)]
+
+    async def generate(self, prompt: str) -> str:
+        rng = self._start(prompt)
+        await self._first_token(rng)
+        words = self._words(rng)
+        if self.tokens_per_second > 0:
+            await asyncio.sleep(len(words) / self.tokens_per_second)
+        return " ".join(words)
+
+    async def stream(self, prompt: str, chunk_tokens: int = 8) -> AsyncIterator[str]:
+        rng = self._start(prompt)
+        await self._first_token(rng)
+        words = self._words(rng)
+        for i in range(0, len(words), chunk_tokens):
+            chunk = words[i:i + chunk_tokens]
+            if self.tokens_per_second > 0:
+                await asyncio.sleep(len(chunk) / self.tokens_per_second)
+            yield ("" if i == 0 else " ") + " ".join(chunk)
+
+    def count_tokens(self, text: str) -> int:
+        return estimate_tokens(text)
+
+def make_llm_backend(name: str = LLM_BACKEND) -> LLMBackend:
+    if name == "fake":
+        return FakeBackend()
+    if name == "gemini":
+        return GeminiBackend()
+    raise ValueError(f"Unknown LLM_BACKEND: {name}")
+
+llm_backend: LLMBackend = make_llm_backend()
+
+llm_cache = TieredCache(
+    TTLCache(LLM_CACHE_TTL, LLM_CACHE_MAX_ENTRIES, LLM_CACHE_MAX_BYTES),
+    open_disk_cache(LLM_CACHE_DB, LLM_CACHE_TTL, LLM_CACHE_DB_MAX_BYTES),
+)
+
+def llm_cache_key(full_prompt: str) -> str:
+    """Hash everything that determines the model's answer to a prompt."""
+    payload = json.dumps(
+        [llm_backend.name, full_prompt, SAFETY_SETTINGS, GENERATION_CONFIG],
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+# Concurrent misses for the same prompt share one model call
+llm_flight = SingleFlight()
+
+async def cached_llm_response(key: str) -> Optional[str]:
+    response = llm_cache.get(key)
+    if response is None:
+        response = await llm_cache.load(key)
+    return response
+
+async def get_gemini_response(prompt: str, context: str = "", use_cache: bool = True,
+                              priority: int = PRIORITY_INTERACTIVE) -> str:
+    """Get response from Gemini model with context.
+
+    Successful responses are cached by prompt; pass use_cache=False to always
+    call the model (the fresh answer still refreshes the cache). Identical
+    prompts already being answered wait for that answer instead. Calls queue
+    for admission, with interactive turns ahead of background work.
+    """
+    full_prompt = build_prompt(prompt, context)
+    key = llm_cache_key(full_prompt)
+    if use_cache:
+        cached = await cached_llm_response(key)
+        if cached is not None:
+            return cached
+    async def generate() -> str:
+        timer = queued_call_timer()
+        async with llm_admission.slot(estimate_request_tokens(full_prompt), priority, admission_timeout()):
+            timer.start()
+            return await llm_backend.generate(full_prompt)
+
+    async def fetch() -> str:
+        try:
+            text = await call_with_retries("gemini", generate)
+        except Exception as e:
+            error_message = f"{ERROR_REPLY}: {str(e)}"
+            log.error("Gemini API Error: %s", e)
+            return error_message
+        await llm_cache.set(key, text)
+        return text
+
+    return await llm_flight.do(key, fetch)
+
+async def stream_gemini_response(prompt: str, context: str = "", use_cache: bool = True) -> str:
+    """Stream a Gemini response into a new chat message and return its full text.
+
+    Cached responses are sent whole instead of being streamed, as are
+    replies another caller is already generating for the same prompt.
+    """
+    full_prompt = build_prompt(prompt, context)
+    key = llm_cache_key(full_prompt)
+    msg = cl.Message(content="")
+    cached = await cached_llm_response(key) if use_cache else None
+    if cached is not None:
+        msg.content = cached
+        await msg.send()
+        return cached
+    async def generate() -> None:
+        timer = queued_call_timer()
+        async with llm_admission.slot(estimate_request_tokens(full_prompt), timeout=admission_timeout()):
+            timer.start()
+            async for text in llm_backend.stream(full_prompt):
+                await msg.stream_token(text)
+
+    async def fetch() -> str:
+        try:
+            # Once tokens are on screen a retry would repeat them, so only retry
+            # failures that happen before the first chunk
+            await call_with_retries("gemini", generate, lambda e: not msg.content and is_retryable(e))
+        except Exception as e:
+            log.error("Gemini API Error: %s", e)
+            separator = "\n\n" if msg.content else ""
+            await msg.stream_token(f"{separator}{ERROR_REPLY}: {str(e)}")
+        else:
+            await llm_cache.set(key, msg.content)
+        return msg.content
+
+    # Only the caller whose fetch runs streams; the others get the whole text
+    msg.content = await llm_flight.do(key, fetch)
+    await msg.send()
+    return msg.content
+
+async def send_gemini_response(prompt: str, context: str = "", use_cache: bool = True) -> str:
+    """Answer with Gemini, streaming tokens when enabled, and record the reply."""
+    if GEMINI_STREAMING:
+        response = await stream_gemini_response(prompt, context, use_cache)
+    else:
+        response = await get_gemini_response(prompt, context, use_cache)
+        await cl.Message(content=response).send()
+    add_to_conversation_history(response, "assistant")
+    return response
+
+# Tasks started with run_in_background, kept referenced until they finish
+background_tasks: set = set()
+
+def run_in_background(coro) -> asyncio.Task:
+    """Start a fire-and-forget task that is not garbage collected mid-flight."""
+    task = asyncio.ensure_future(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+Vector = Dict[int, float]
+
+EMBEDDING_DIM = 1024
+# Words that carry no meaning in this domain; question words are kept so
+# "how long" and "when" questions stay apart.
+_EMBEDDING_STOP_WORDS = frozenset(
+    "a an the to i my me should do does is are in on of for be it at with and or "
+    "can you your morning routine".split()
+)
+
+def _normalize(vector: Vector) -> Vector:
+    norm = math.sqrt(sum(x * x for x in vector.values())) or 1.0
+    return {i: x / norm for i, x in vector.items()}
+
+def local_embedding(text: str) -> Vector:
+    """Deterministic hashed embedding of words, word bigrams and character trigrams.
+
+    Needs no network or model, so it doubles as the offline fallback.
+    """
+    words = [w for w in re.findall(r"[a-z0-9']+", text.lower()) if w not in _EMBEDDING_STOP_WORDS]
+    features = [(f"w:{w}", 2.0) for w in words]
+    features += [(f"b:{a} {b}", 1.0) for a, b in zip(words, words[1:])]
+    for w in words:
+        padded = f"<{w}>"
+        features += [(f"c:{padded[i:i + 3]}", 1.0) for i in range(len(padded) - 2)]
+    vector: Vector = {}
+    for feature, weight in features:
+        h = zlib.crc32(feature.encode())
+        index = h % EMBEDDING_DIM
+        vector[index] = vector.get(index, 0.0) + (weight if h & 0x80000000 else -weight)
+    return _normalize(vector)
+
+def gemini_embedding(text: str) -> Vector:
+    get_model()  # configures the API key
+    import google.generativeai as genai
+    result = genai.embed_content(model="models/text-embedding-004", content=text)
+    return _normalize(dict(enumerate(result["embedding"])))
+
+async def embed_text(text: str) -> tuple:
+    """Return (embedding space, vector); vectors from different spaces never match."""
+    if SEMANTIC_CACHE_EMBEDDER == "gemini":
+        try:
+            return "gemini", await asyncio.to_thread(gemini_embedding, text)
+        except Exception as e:
+            log.warning("Embedding error, using local embedding: %s", e)
+    return "local", local_embedding(text)
+
+def cosine_similarity(a: Vector, b: Vector) -> float:
+    """Cosine similarity of two normalized sparse vectors."""
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(x * b.get(i, 0.0) for i, x in a.items())
+
+_NUMBER_PATTERN = re.compile(r"\d+(?:[.,]\d+)?")
+
+def context_signature(context: str) -> str:
+    """Short digest of the context (preferences, summary, history) an answer depends on."""
+    return hashlib.sha1(context.lower().encode()).hexdigest()[:12]
+
+def semantic_partition(space: str, prompt: str, context: str) -> tuple:
+    """Cache partition of a question: only questions with the same context and
+    the same numbers ("20 minutes" vs "10 minutes") may share an answer."""
+    return space, context_signature(context), tuple(_NUMBER_PATTERN.findall(prompt))
+
+class SemanticCache:
+    """Reuse answers to questions whose embeddings are close enough.
+
+    Entries live in partitions (see semantic_partition), so an answer is only
+    reused for the same conversation context.
+    """
+
+    def __init__(self, threshold: float, max_entries: int, ttl: float):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.false_hits = 0
+        self.verified = 0
+        self._next_id = 0
+        self._entries: OrderedDict = OrderedDict()  # id -> (partition, vector, response, expires_at)
+
+    def lookup(self, partition: Any, vector: Vector) -> Optional[tuple]:
+        """Return (entry id, response) of the closest live match, or None."""
+        now = time.monotonic()
+        best_id, best_score = None, self.threshold
+        for entry_id, (entry_partition, entry_vector, _, expires_at) in self._entries.items():
+            if entry_partition != partition or expires_at < now:
+                continue
+            score = cosine_similarity(vector, entry_vector)
+            if score >= best_score:
+                best_id, best_score = entry_id, score
+        if best_id is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(best_id)
+        return best_id, self._entries[best_id][2]
+
+    def add(self, partition: Any, vector: Vector, response: str) -> None:
+        self._next_id += 1
+        self._entries[self._next_id] = (partition, vector, response, time.monotonic() + self.ttl)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def discard(self, entry_id: int) -> None:
+        self._entries.pop(entry_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "verified": self.verified,
+            "false_hits": self.false_hits,
+            "false_hit_rate": self.false_hits / self.verified if self.verified else 0.0,
+        }
+
+semantic_cache = SemanticCache(SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_MAX_ENTRIES, SEMANTIC_CACHE_TTL)
+
+async def verify_semantic_hit(entry_id: int, cached: str, prompt: str, context: str) -> None:
+    """Answer a cache hit afresh and count it as false if the answers diverge."""
+    turn_deadline.set(None)  # background work isn't bound by the user's turn
+    fresh = await get_gemini_response(prompt, context, use_cache=False, priority=PRIORITY_BACKGROUND)
+    if is_error_reply(fresh):
+        return
+    semantic_cache.verified += 1
+    if cosine_similarity(local_embedding(fresh), local_embedding(cached)) < SEMANTIC_CACHE_VERIFY_THRESHOLD:
+        semantic_cache.false_hits += 1
+        semantic_cache.discard(entry_id)
+
+async def send_followup_response(prompt: str, context: str) -> str:
+    """Answer a free-form question, reusing the answer to a near-duplicate one."""
+    if not SEMANTIC_CACHE_ENABLED:
+        return await send_gemini_response(prompt, context)
+    space, vector = await embed_text(prompt)
+    partition = semantic_partition(space, prompt, context)
+    match = semantic_cache.lookup(partition, vector)
+    if match is not None:
+        entry_id, response = match
+        await cl.Message(content=response).send()
+        add_to_conversation_history(response, "assistant")
+        if random.random() < SEMANTIC_CACHE_VERIFY_RATE:
+            run_in_background(verify_semantic_hit(entry_id, response, prompt, context))
+        return response
+    response = await send_gemini_response(prompt, context)
+    if not is_error_reply(response):
+        semantic_cache.add(partition, vector, response)
+    return response
 
 def add_to_conversation_history(message: str, role: str = "user") -> None:
-    """Add a message to the conversation history with proper typing."""
-    user_data["conversation_history"].append(Message(
-        role=role,
-        content=message,
-        timestamp=datetime.now().isoformat()
-    ))
+    """Add a message to the current session's conversation history."""
+    get_user_data()["conversation_history"].append(role, message)
 
 @cl.on_message
 async def on_message(message: cl.Message):
     content = message.content.lower()
+    turn_deadline.set(time.monotonic() + TURN_BUDGET)
+    request_id.set(uuid.uuid4().hex[:12])
+    load_intent_classifier()
+    user_data = get_user_data()
     
     # Add message to conversation history
     add_to_conversation_history(message.content)
     
     try:
-        # Handle YouTube search requests
-        if any(keyword in content for keyword in ["youtube", "video", "watch"]):
-            search_query = content
-            for keyword in ["youtube", "video", "watch", "find", "search"]:
-                search_query = search_query.replace(keyword, "").strip()
-            
+        intent, search_query = classify_message(content)
+        log.debug("Routed message", extra={"session_id": cl.context.session.id, "intent": intent})
+
+        # Handle requests for both videos and reading material
+        if intent == INTENT_ALL:
             if not search_query:
-                search_query = "morning routine motivation"
+                search_query = WEB_DEFAULT_QUERY
             
-            print(f"Processing YouTube search request: {search_query}")  # Debug log
-            results = await search_youtube(search_query)
-            print(f"Search returned {len(results)} results")  # Debug log
+            results = await search_all(search_query)
             
             if results:
+                response = "Here are some videos and articles:\n\n"
+                response += "".join(
+                    format_video(result) if result["kind"] == "video" else format_web(result)
+                    for result in results
+                )
+            else:
+                response = "I couldn't find any relevant results. Would you like to try a different search query?"
+            
+            add_to_conversation_history(response, "assistant")
+            await cl.Message(content=response).send()
+            return
+
+        # Handle YouTube search requests
+        if intent == INTENT_VIDEO:
+            if not search_query:
+                search_query = VIDEO_FALLBACK_QUERY
+            
+            log.debug("Processing YouTube search request: %s", search_query)
+            results, used_fallback = await search_youtube_hedged(search_query)
+            log.debug("Search returned %d results", len(results))
+            
+            if results and not used_fallback:
                 response = "Here are some relevant videos:\n\n"
-                for result in results:
-                    response += f"📺 {result['title']}\n"
-                    response += f"🔗 {result['link']}\n"
-                    response += f"⏱️ Duration: {result['duration']}\n"
-                    response += f"👤 Channel: {result['channel']}\n\n"
+                response += "".join(format_video(result) for result in results)
+            elif results:
+                response = "Here are some motivational morning routine videos:\n\n"
+                response += "".join(format_video(result) for result in results)
             else:
-                response = "I couldn't find any relevant videos. Let me try a different search approach..."
-                # Try a more generic search if specific search fails
-                fallback_query = "morning routine motivation"
-                print(f"Trying fallback search: {fallback_query}")  # Debug log
-                fallback_results = await search_youtube(fallback_query)
-                
-                if fallback_results:
-                    response = "Here are some motivational morning routine videos:\n\n"
-                    for result in fallback_results:
-                        response += f"📺 {result['title']}\n"
-                        response += f"🔗 {result['link']}\n"
-                        response += f"⏱️ Duration: {result['duration']}\n"
-                        response += f"👤 Channel: {result['channel']}\n\n"
-                else:
-                    response = "I apologize, but I'm having trouble finding videos right now. Would you like to try a different type of search or continue with creating a morning routine?"
+                response = "I apologize, but I'm having trouble finding videos right now. Would you like to try a different type of search or continue with creating a morning routine?"
             
             add_to_conversation_history(response, "assistant")
             await cl.Message(content=response).send()
             return
 
         # Handle web search requests
-        if any(keyword in content for keyword in ["search", "find", "look for"]):
-            search_query = content
-            for keyword in ["search", "find", "look for"]:
-                search_query = search_query.replace(keyword, "").strip()
-            
+        if intent == INTENT_WEB:
             if not search_query:
-                search_query = "morning routine tips"
+                search_query = WEB_DEFAULT_QUERY
             
-            print(f"Searching web for: {search_query}")  # Debug log
+            log.debug("Searching web for: %s", search_query)
             results = await search_web(search_query)
             
             if results:
                 response = "Here are some relevant resources:\n\n"
-                for result in results:
-                    response += f"📚 {result['title']}\n"
-                    response += f"🔗 {result['link']}\n"
-                    response += f"📝 {result['snippet'][:200]}...\n\n"
+                response += "".join(format_web(result) for result in results)
             else:
                 response = "I couldn't find any relevant results. Would you like to try a different search query?"
             
@@ -228,34 +2101,25 @@ async def on_message(message: cl.Message):
 
         # Original morning routine logic
         if "help me create a personalized morning routine" in content:
-            response = await get_gemini_response(
-                "Start a conversation about creating a morning routine. Ask about current habits.",
-                "You are a morning routine expert. Start by asking about the user's current morning habits."
-            )
-            add_to_conversation_history(response, "assistant")
-            await cl.Message(content=response).send()
+            await send_gemini_response(ROUTINE_OPENER_PROMPT, ROUTINE_OPENER_CONTEXT)
             return
         
         # If we're collecting current habits
         if not user_data["current_habits"]:
             user_data["current_habits"] = [habit.strip() for habit in content.split(",")]
-            response = await get_gemini_response(
+            await send_gemini_response(
                 "Ask about energizing morning activities",
-                f"User's current habits: {', '.join(user_data['current_habits'])}"
+                build_context(preference_fields(user_data))
             )
-            add_to_conversation_history(response, "assistant")
-            await cl.Message(content=response).send()
             return
         
         # If we're collecting energizing activities
         if not user_data["energizing_activities"]:
             user_data["energizing_activities"] = [activity.strip() for activity in content.split(",")]
-            response = await get_gemini_response(
+            await send_gemini_response(
                 "Ask about morning goals",
-                f"User's current habits: {', '.join(user_data['current_habits'])}\nEnergizing activities: {', '.join(user_data['energizing_activities'])}"
+                build_context(preference_fields(user_data))
             )
-            add_to_conversation_history(response, "assistant")
-            await cl.Message(content=response).send()
             return
         
         # If we're collecting goals
@@ -263,44 +2127,32 @@ async def on_message(message: cl.Message):
             user_data["goals"] = [goal.strip() for goal in content.split(",")]
             
             # Generate personalized morning routine using Gemini
-            context = f"""
-            User's current habits: {', '.join(user_data['current_habits'])}
-            Energizing activities: {', '.join(user_data['energizing_activities'])}
-            Goals: {', '.join(user_data['goals'])}
-            
-            Create a detailed, personalized morning routine that incorporates these elements.
-            Include specific timing suggestions and explain the benefits of each activity.
-            """
-            
-            routine = await get_gemini_response("Generate a morning routine", context)
-            add_to_conversation_history(routine, "assistant")
-            await cl.Message(content=routine).send()
+            context = build_context(preference_fields(user_data)) + (
+                "\n\nCreate a detailed, personalized morning routine that incorporates these elements."
+                "\nInclude specific timing suggestions and explain the benefits of each activity."
+            )
             
-            follow_up = await get_gemini_response(
+            # The follow-up question doesn't depend on the routine, so generate
+            # it while the routine is being written and send it afterwards
+            follow_up_task = asyncio.create_task(get_gemini_response(
                 "Ask if they want to make any adjustments or need explanations",
                 "You've just provided a morning routine. Ask if they want to make adjustments or need explanations."
-            )
+            ))
+            try:
+                await send_gemini_response("Generate a morning routine", context)
+                follow_up = await follow_up_task
+            finally:
+                follow_up_task.cancel()
             add_to_conversation_history(follow_up, "assistant")
             await cl.Message(content=follow_up).send()
             return
         
         # Handle follow-up questions using Gemini
-        context = f"""
-        User's preferences:
-        - Current habits: {', '.join(user_data['current_habits'])}
-        - Energizing activities: {', '.join(user_data['energizing_activities'])}
-        - Goals: {', '.join(user_data['goals'])}
-        
-        Previous conversation: {str(user_data['conversation_history'][-5:])}
-        """
-        
-        response = await get_gemini_response(message.content, context)
-        add_to_conversation_history(response, "assistant")
-        await cl.Message(content=response).send()
+        await send_followup_response(message.content, followup_context(user_data))
         
     except Exception as e:
-        error_message = f"I apologize, but I encountered an error: {str(e)}"
-        print(f"Error in message handling: {str(e)}")  # Log the error for debugging
+        error_message = f"{ERROR_REPLY}: {str(e)}"
+        log.exception("Error in message handling: %s", e)
         await cl.Message(content=error_message).send()
 
 def generate_morning_routine(user_data: UserData) -> str:
@@ -0,0 +1,22 @@
+"""Helpers for loading morning-bot.py from the tests."""
+import importlib.util
+import os
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def load_bot():
+    """Import morning-bot.py as a module (the file name is not importable),
+    offline: the fake Gemini backend and no cache warmup."""
+    os.environ.setdefault("GEMINI_API_KEY", "test")
+    os.environ.setdefault("LLM_BACKEND", "fake")
+    os.environ.setdefault("WARMUP_ENABLED", "false")
+    if "morning_bot" in sys.modules:
+        return sys.modules["morning_bot"]
+    spec = importlib.util.spec_from_file_location("morning_bot", ROOT / "morning-bot.py")
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["morning_bot"] = module
+    spec.loader.exec_module(module)
+    return module
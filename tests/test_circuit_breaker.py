@@ -0,0 +1,169 @@
+"""State changes of CircuitBreaker, and what it counts as backend latency.
+
+    python -m unittest discover tests
+"""
+import asyncio
+import time
+import unittest
+
+from _bot import load_bot
+
+bot = load_bot()
+
+
+async def ok():
+    return "ok"
+
+
+async def fail():
+    raise ConnectionError("backend down")
+
+
+def breaker(**kwargs):
+    options = dict(window=60, min_calls=4, failure_rate=0.5, slow_call_rate=0.5, open_seconds=0.05)
+    options.update(kwargs)
+    return bot.CircuitBreaker("test", slow_call_seconds=0.05, **options)
+
+
+class CircuitBreakerStateTest(unittest.IsolatedAsyncioTestCase):
+    async def trip(self, b):
+        for _ in range(b.min_calls):
+            with self.assertRaises(ConnectionError):
+                await b.call(fail)
+        self.assertEqual(b.state, b.OPEN)
+
+    async def test_stays_closed_below_min_calls(self):
+        b = breaker()
+        for _ in range(b.min_calls - 1):
+            with self.assertRaises(ConnectionError):
+                await b.call(fail)
+        self.assertEqual(b.state, b.CLOSED)
+
+    async def test_opens_on_failure_rate_and_rejects(self):
+        b = breaker()
+        await self.trip(b)
+        called = []
+
+        async def track():
+            called.append(True)
+
+        with self.assertRaises(bot.CircuitOpenError):
+            await b.call(track)
+        self.assertEqual(called, [])
+        self.assertEqual(b.stats(), {"state": b.OPEN, "opened": 1, "rejected": 1})
+
+    async def test_opens_on_slow_calls(self):
+        b = breaker()
+
+        async def slow():
+            await asyncio.sleep(0.1)
+
+        for _ in range(b.min_calls):
+            await b.call(slow)
+        self.assertEqual(b.state, b.OPEN)
+
+    async def test_half_open_probe_success_closes(self):
+        b = breaker()
+        await self.trip(b)
+        await asyncio.sleep(b.open_seconds * 2)
+        self.assertEqual(b.state, b.HALF_OPEN)
+        self.assertEqual(await b.call(ok), "ok")
+        self.assertEqual(b.state, b.CLOSED)
+
+    async def test_half_open_probe_failure_reopens(self):
+        b = breaker()
+        await self.trip(b)
+        await asyncio.sleep(b.open_seconds * 2)
+        with self.assertRaises(ConnectionError):
+            await b.call(fail)
+        self.assertEqual(b.state, b.OPEN)
+        self.assertEqual(b.opened, 2)
+
+    async def test_half_open_allows_a_single_probe(self):
+        b = breaker()
+        await self.trip(b)
+        await asyncio.sleep(b.open_seconds * 2)
+        release = asyncio.Event()
+
+        async def probe():
+            await release.wait()
+            return "ok"
+
+        first = asyncio.create_task(b.call(probe))
+        await asyncio.sleep(0)
+        with self.assertRaises(bot.CircuitOpenError):
+            await b.call(ok)
+        release.set()
+        self.assertEqual(await first, "ok")
+        self.assertEqual(b.state, b.CLOSED)
+
+
+class CircuitBreakerTimingTest(unittest.IsolatedAsyncioTestCase):
+    async def test_time_queued_before_the_backend_is_not_counted(self):
+        b = breaker()
+
+        async def queued_then_fast():
+            timer = bot.queued_call_timer()
+            await asyncio.sleep(0.1)  # waiting for our own slot
+            timer.start()
+            return "ok"
+
+        for _ in range(b.min_calls * 2):
+            await b.call(queued_then_fast)
+        self.assertEqual(b.state, b.CLOSED)
+
+    async def test_failure_before_the_backend_is_not_counted(self):
+        b = breaker()
+
+        async def rejected_while_queued():
+            bot.queued_call_timer()
+            raise asyncio.TimeoutError("gave up waiting for a slot")
+
+        for _ in range(b.min_calls * 2):
+            with self.assertRaises(asyncio.TimeoutError):
+                await b.call(rejected_while_queued)
+        self.assertEqual(b.state, b.CLOSED)
+
+    async def test_search_pool_queue_is_not_counted(self):
+        b = breaker()
+        b.slow_call_seconds = 0.25
+        original = bot.circuit_breakers["duckduckgo"]
+        bot.circuit_breakers["duckduckgo"] = b
+        self.addCleanup(bot.circuit_breakers.__setitem__, "duckduckgo", original)
+
+        def search():
+            time.sleep(0.1)
+            return ["result"]
+
+        # Six waves of searches: each search takes 0.1s, well under the slow
+        # call threshold, but counting the queueing would make the last
+        # waves (0.3s to 0.6s) slow
+        calls = [
+            bot.call_with_retries("duckduckgo", lambda: bot.run_search(search))
+            for _ in range(bot.SEARCH_MAX_WORKERS * 6)
+        ]
+        await asyncio.gather(*calls)
+        self.assertEqual(b.state, b.CLOSED)
+
+    async def test_gemini_admission_queue_is_not_counted(self):
+        b = breaker()
+        b.slow_call_seconds = 0.25
+        original = (bot.circuit_breakers["gemini"], bot.llm_backend, bot.llm_admission)
+        bot.circuit_breakers["gemini"] = b
+        bot.llm_backend = bot.FakeBackend(latency=0.1, sigma=0, tokens_per_second=0, error_rate=0)
+        bot.llm_admission = bot.AdmissionController(2, 0, 0)
+
+        def restore():
+            bot.circuit_breakers["gemini"], bot.llm_backend, bot.llm_admission = original
+
+        self.addCleanup(restore)
+        # Two at a time, so as above the 12 calls come in six waves of 0.1s
+        replies = await asyncio.gather(*(
+            bot.get_gemini_response(f"prompt {i}", use_cache=False) for i in range(12)
+        ))
+        self.assertFalse(any(bot.is_error_reply(r) for r in replies))
+        self.assertEqual(b.state, b.CLOSED)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+"""Message routing: route_message's keyword rules and classify_message.
+
+    python -m unittest discover tests
+"""
+import json
+import unittest
+
+from _bot import load_bot
+
+bot = load_bot()
+
+# (message, expected intent, expected query)
+CORPUS = [
+    ("find me a motivational morning routine video on youtube.", "video", "me a motivational morning routine on ."),
+    ("find me some morning routine tips and articles.", "web", "me some morning routine tips and articles."),
+    ("youtube", "video", ""),
+    ("watch", "video", ""),
+    ("show me videos about yoga", "video", "show me about yoga"),
+    ("search for stretching routines", "web", "for stretching routines"),
+    ("can you look for breakfast ideas", "web", "can you breakfast ideas"),
+    ("search youtube for meditation", "video", "for meditation"),
+    ("find me videos and articles about yoga", "all", "me about yoga"),
+    ("any youtube clips or blog posts on journaling", "all", "any clips on journaling"),
+    ("search the web and youtube for yoga", "all", "for yoga"),
+    ("youtube videos and web results about stretching", "all", "about stretching"),
+    ("any articles about caffeine timing", None, "any articles about caffeine timing"),
+    ("i am watchful of my sleep", None, "i am watchful of my sleep"),
+    ("i need to refind my motivation", None, "i need to refind my motivation"),
+    ("my habits are coffee, email", None, "my habits are coffee, email"),
+    ("i research my day over coffee", None, "i research my day over coffee"),
+    ("overlook for now", None, "overlook for now"),
+    ("help me create a personalized morning routine", None, "help me create a personalized morning routine"),
+]
+
+# (message, expected intent) for classify_message. These are held out: none
+# is in the training corpus. Most are routed wrongly or not at all by the
+# keyword rules.
+CLASSIFIER_CASES = [
+    ("could you find me twenty minutes for a workout before my commute", None),
+    ("can you find a way to stop hitting snooze", None),
+    ("i watch the news while eating, is that ok", None),
+    ("i like to watch the sunrise, where does that fit", None),
+    ("is it bad to skip breakfast when i train early", None),
+    ("show me something to watch while i stretch", "video"),
+    ("i would like a clip that walks me through a sunrise meditation", "video"),
+    ("pull up a guided breathing session i can follow along with", "video"),
+    ("dig up some studies about cold showers", "web"),
+]
+
+
+class RouteMessageTest(unittest.TestCase):
+    def test_corpus(self):
+        for message, intent, query in CORPUS:
+            with self.subTest(message=message):
+                self.assertEqual(bot.route_message(message), (intent, query))
+
+
+class ClassifyMessageTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        bot.get_intent_classifier()
+
+    def test_cases_are_held_out(self):
+        with open(bot.INTENT_CORPUS, encoding="utf-8") as f:
+            trained = {json.loads(line)["text"].strip(" ?.!").lower() for line in f if line.strip()}
+        for message, _ in CLASSIFIER_CASES:
+            with self.subTest(message=message):
+                self.assertNotIn(message.strip(" ?.!").lower(), trained)
+
+    def test_cases(self):
+        for message, intent in CLASSIFIER_CASES:
+            with self.subTest(message=message):
+                self.assertEqual(bot.classify_message(message)[0], intent)
+
+
+if __name__ == "__main__":
+    unittest.main()